@@ -1,9 +1,7 @@
-import gurobipy as gp
-from gurobipy import GRB
-import networkx as nx
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import travel_times
+from export import format_times
 
 def diff(first, second):
         second = set(second)
@@ -15,80 +13,307 @@ def generate_start_times(num_schools):
     
     return time_list
 
-def get_feasible_routes(num_students, num_schools, start_times, travel_time, coords, max_routes=10):
-    print('Setting up mixed-integer program...')
-    d = [0]
-    P = list(range(1, 1 + num_students))
-    S = list(range(num_students + 1, num_students + num_schools + 1))
-    L = d + P + S
-    O = list(range(num_students + num_schools + 1))
-
-    school_earliest_dropoff_buffer = 30 # minutes lower bound on dropoff i.e. time window for dropoff [8:00 to 8:30am]
-    school_latest_dropoff_buffer = 10 # minutes upper bound on dropoff i.e. time window for dropoff [8:00 to (8:30-10min)]
-    student_loading_buffer = 2 # minutes
+# time window for dropoff, e.g. for an 8:30am start: [8:00 to (8:30-10min)]
+school_earliest_dropoff_buffer = 30 # minutes lower bound on dropoff
+school_latest_dropoff_buffer = 10 # minutes upper bound on dropoff
+student_loading_buffer = 2 # added to the travel time into every student/school
 
-    school_start_times = np.ones(len(L)) * (60*60*12)
-    for i in range(len(S)):
-        time = datetime.strptime(start_times[i], "%H:%M:%S")
-        seconds = time.hour * 3600 + time.minute * 60 + time.second
-        school_start_times[i+len(P)+1] = seconds
+# big-M of the StartTimes constraints, one day in seconds. It is the same for every scenario, so loading a scenario
+# into a model only changes right hand sides and bounds. Arcs too long for it can't be in any route and are switched off
+BigM = 24 * 60 * 60
 
-    school_earliest_dropoff_times = school_start_times - (school_earliest_dropoff_buffer*60) 
-    school_latest_dropoff_times = school_start_times - (school_latest_dropoff_buffer*60) 
+# default upper bound on driving speed (m/s), used for straight-line lower bounds on travel times when pruning arcs.
+# Pruning is only exact if no edge of the graph is faster (30 m/s = 108 km/h), otherwise it is a heuristic, pass
+# travel_times.max_edge_speed(G) to candidate_arcs to derive the bound from the graph's speed_kph values instead
+max_speed = 30
 
+def generate_school_choices(num_students, num_schools):
+    """ Randomly assign a school to every student, returns an array of school node IDs indexed by student - 1 """
+    S = list(range(num_students + 1, num_students + num_schools + 1))
     choices = np.random.choice(S, num_students)
     # A = np.zeros((len(L), choices.max() + 1))
     # ^ index out-of-bounds error in PickupOrder constraint occurs when not all schools are selected in choices
-    while choices.max() + 1 != len(L):
+    while choices.max() != S[-1]:
         choices = np.random.choice(S, num_students)
+    return choices
+
+def school_time_windows(num_students, num_schools, start_times):
+    """ Return (earliest, latest) dropoff times in seconds for every node, only the school entries are meaningful """
+    n = num_students + num_schools + 1
+    school_start_times = np.ones(n) * (60*60*12)
+    for i in range(num_schools):
+        time = datetime.strptime(start_times[i], "%H:%M:%S")
+        seconds = time.hour * 3600 + time.minute * 60 + time.second
+        school_start_times[i+num_students+1] = seconds
+
+    school_earliest_dropoff_times = school_start_times - (school_earliest_dropoff_buffer*60) 
+    school_latest_dropoff_times = school_start_times - (school_latest_dropoff_buffer*60) 
+    return school_earliest_dropoff_times, school_latest_dropoff_times
+
+def travel_time_lower_bounds(coords, speed=max_speed):
+    """ Straight-line (haversine) distance between every pair of locations divided by speed (m/s), in seconds """
+    points = np.radians(np.array([coords[i] for i in range(len(coords))]))
+    lat, lng = points[:, 0], points[:, 1]
+    dlat = lat[None, :] - lat[:, None]
+    dlng = lng[None, :] - lng[:, None]
+    a = np.sin(dlat / 2)**2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlng / 2)**2
+    meters = 2 * 6371009 * np.arcsin(np.sqrt(a))
+    return meters / speed
+
+def candidate_arcs(num_students, num_schools, start_times, choices, coords, k_nearest=None, speed=None):
+    """Find the arcs (i, j) that can appear in a feasible route, so only those need travel times and variables.
+
+    Parameters:
+    -----------
+    num_students, num_schools : int
+        Number of student and school locations.
+    start_times : list of str
+        School start times as HH:MM:SS strings.
+    choices : numpy.ndarray
+        The school node ID of every student, see generate_school_choices.
+    coords : dict
+        A dictionary mapping node IDs to (latitude, longitude) tuples.
+    k_nearest : int, optional
+        Additionally keep only the k nearest (by straight-line distance) successors of every node. This is a
+        heuristic and can remove arcs used by the optimal route. Default is None (no limit).
+    speed : float, optional
+        Upper bound on the travel speed in m/s, e.g. travel_times.max_edge_speed(G). The pruning never removes a
+        feasible arc as long as no edge is faster. Default is max_speed.
+
+    Returns:
+    --------
+    list of tuple
+        The (i, j) arcs that are kept. Arcs are dropped if they go into the depot, go from the depot straight to a
+        school that still has students to pick up, drop a student's school before picking the student up, or cannot
+        reach a later school within its time window even at the given speed.
+    """
+    P = list(range(1, 1 + num_students))
+    S = list(range(num_students + 1, num_students + num_schools + 1))
+    L = [0] + P + S
+    earliest, latest = school_time_windows(num_students, num_schools, start_times)
+    school_of = {p: choices[p-1] for p in P}
+    lb = travel_time_lower_bounds(coords, max_speed if speed is None else speed)
+
+    arcs = []
+    for i in L:
+        successors = []
+        for j in L:
+            if i == j or j == 0:
+                continue
+            # every school with students assigned must come after their pickups
+            if i == 0 and j in S and j in school_of.values():
+                continue
+            if i in S:
+                # leaving school i no earlier than its earliest dropoff time
+                if j in S and earliest[i] + lb[i, j] > latest[j]:
+                    continue
+                if j in P and (school_of[j] == i or earliest[i] + lb[i, j] + lb[j, school_of[j]] > latest[school_of[j]]):
+                    continue
+            successors.append(j)
+        if k_nearest is not None:
+            successors = sorted(successors, key=lambda j: lb[i, j])[:k_nearest]
+        arcs.extend((i, j) for j in sorted(successors))
+    return arcs
+
+def problem_data(num_students, num_schools, start_times, travel_time, choices=None):
+    """Collect the data of one scenario, i.e. everything that differs between models of the same size.
+
+    travel_time is either the dense (n+1) x (n+1) array from travel_times.calculate_travel_times or a sparse
+    {(i, j): seconds} dict over candidate_arcs. choices (the school of every student) is drawn at random if not given,
+    it must be the one candidate_arcs was called with.
+
+    Returns:
+    --------
+    dict
+        'tt' maps every usable arc (i, j) to its travel time plus loading buffer, 'A' is the student -> school
+        assignment matrix and 'earliest'/'latest' are the dropoff windows.
+    """
+    L = list(range(num_students + num_schools + 1))
+
+    school_earliest_dropoff_times, school_latest_dropoff_times = school_time_windows(num_students, num_schools, start_times)
+
+    if choices is None:
+        choices = generate_school_choices(num_students, num_schools)
     A = np.zeros((len(L), len(L))) 
     A[np.arange(choices.size)+1, choices] = 1
 
-    for j in (P+S):
-        travel_time[:,j] = travel_time[:,j] + student_loading_buffer
-    
-    BigM = np.max(school_start_times) + np.max(travel_time)
+    # travel times (plus loading buffer) of every arc that gets variables
+    if isinstance(travel_time, dict):
+        tt = {(i, j): t + (student_loading_buffer if j != 0 else 0) for (i, j), t in travel_time.items()}
+    else:
+        tt = {(i, j): travel_time[i, j] + (student_loading_buffer if j != 0 else 0) for i in L for j in L if i != j}
 
-    print('Building model...')
-    m = gp.Model("bus_route")
+    return {'tt': tt, 'A': A, 'earliest': school_earliest_dropoff_times, 'latest': school_latest_dropoff_times}
+
+def build_model(num_students, num_schools, arcs, env=None):
+    """Build the structure of the routing model over the given arcs, the data is filled in by set_model_data.
+
+    The model can be re-solved for any scenario of the same size whose arcs are a subset of arcs. The variables and
+    constraints that set_model_data changes are kept on the model as m._X, m._Y, m._K, m._pickup_order, m._start_times,
+    m._latest and m._earliest.
+    """
+    # gurobipy is imported here so the license is only checked out once a model is actually built
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    d = [0]
+    P = list(range(1, 1 + num_students))
+    S = list(range(num_students + 1, num_students + num_schools + 1))
+    L = d + P + S
+    O = list(range(num_students + num_schools + 1))
+
+    m = gp.Model("bus_route", env=env)
     m.Params.OutputFlag = 0 
     m.Params.PoolSearchMode = 1
-    m.Params.PoolSolutions = max_routes
 
-    X = m.addVars(L, L, O, vtype=GRB.BINARY, name="X")
+    X = m.addVars([(i, j, o) for (i, j) in arcs for o in O], vtype=GRB.BINARY, name="X")
 
     Y = m.addVars(diff(L,d), vtype=GRB.INTEGER, name="Y")
 
     K = m.addVars(L, vtype=GRB.CONTINUOUS, name="K")
 
-    m.setObjective(gp.quicksum(travel_time[i,j] * X[i,j,o] for i in L for j in L for o in O) - K[0]/100, GRB.MINIMIZE)
+    # travel time objective coefficients of X are set by set_model_data
+    m.setObjective(-K[0]/100, GRB.MINIMIZE)
+
+    m.addConstr(X.sum(0, '*', 0) == 1 , name="DepotFirst")
+
+    m.addConstrs((X.sum('*', j, '*') == 1 for j in diff(L,d)), name="OneIn")
+
+    m.addConstrs((X.sum(i, '*', '*') <= 1 for i in L), name="OneOut")
 
-    m.addConstr(gp.quicksum(X[0,j,0] for j in L) == 1 , name="DepotFirst")
+    m.addConstrs((X.sum('*', '*', o) == 1 for o in O[:-1]), name="InOrder")
 
-    m.addConstrs((gp.quicksum(X[i,j,o] for i in L for o in O) == 1 for j in diff(L,d)), name="OneIn")
+    m.addConstrs((X.sum('*', j, o) - X.sum(j, '*', o+1) == 0 for j in L for o in O[:-2]), name="Continuity")
 
-    m.addConstrs((gp.quicksum(X[i,j,o] for j in L for o in O) <= 1 for i in L), name="OneOut")
+    order = {key: key[2] for key in X.keys()}
+    m.addConstrs((X.prod(order, '*', j, '*') == Y[j] for j in diff(L,d)), name="AssignOrder")
 
-    m.addConstrs((X[i,i,o] == 0 for i in L for o in O), name="NoSelf")
+    # Y[i] * A[i,s] <= Y[s], the coefficient of Y[i] is set to A[i,s] by set_model_data
+    m._pickup_order = m.addConstrs((Y[i] - Y[s] <= 0 for i in P for s in S), name="PickupOrder")
 
-    m.addConstrs((gp.quicksum(X[i,j,o] for i in L for j in L) == 1 for o in O[:-1]), name="InOrder")
+    # K[i] + tt[i,j] - BigM * (1 - sum_o X[i,j,o]) <= K[j], the right hand side BigM - tt[i,j] is set by set_model_data
+    m._start_times = m.addConstrs((K[i] - K[j] + BigM * X.sum(i, j, '*') <= BigM for i, j in arcs), name="StartTimes")
 
-    m.addConstrs((gp.quicksum(X[i,j,o] for i in L) - gp.quicksum(X[j,k,o+1] for k in L) == 0 for j in L for o in O[:-2]), name="Continuity")
+    m._latest = m.addConstrs((K[s] <= 0 for s in S), name="StartTime")
 
-    m.addConstrs((gp.quicksum(o * X[i,j,o] for i in L for o in O) == Y[j] for j in diff(L,d)), name="AssignOrder")
-    print(len(A), len(A[0]))
-    print(len(Y))
-    m.addConstrs((Y[i] * A[i,s] <= Y[s] for i in P for s in S), name="PickupOrder")
+    m._earliest = m.addConstrs((K[s] >= 0 for s in S), name="DropoffTime")
 
-    m.addConstrs((K[i] + travel_time[i,j] - BigM * (1- gp.quicksum(X[i,j,o] for o in O)) <= K[j] for i in L for j in L), name="StartTimes")
+    m.addConstr(K[0] >= 60*60*6.5, name="Leave depot after 6:30am")
 
+    m._X, m._Y, m._K = X, Y, K
     m.update()
+    return m
 
-    m.addConstrs((K[s] <= school_latest_dropoff_times[s] for s in S), name="StartTime")
+def set_model_data(m, data, max_routes=10):
+    """Load a scenario from problem_data into a model from build_model.
 
-    m.addConstrs((K[s] >= school_earliest_dropoff_times[s] for s in S), name="DropoffTime")
+    Only objective coefficients, bounds, right hand sides and the PickupOrder coefficients change. Arcs without a
+    travel time are switched off, and so are arcs longer than BigM allows for: arriving after one would already be
+    later than every school's latest dropoff.
+    """
+    from gurobipy import GRB
 
-    m.addConstr(K[0] >= 60*60*6.5, name="Leave depot after 6:30am")
+    tt = data['tt']
+    missing = set(tt) - set(m._start_times.keys())
+    if missing:
+        raise ValueError(f'the model has no variables for arcs {sorted(missing)}')
+
+    m.reset()
+    m.Params.PoolSolutions = max_routes
+
+    # every arrival time is at most the latest school dropoff, so BigM covers any arc up to this long
+    max_tt = BigM - max(data['latest'][s] for s in m._latest.keys())
+    usable = {arc for arc, t in tt.items() if t <= max_tt}
+
+    X, Y = m._X, m._Y
+    x_keys = list(X.keys())
+    x_vars = [X[key] for key in x_keys]
+    m.setAttr('Obj', x_vars, [tt.get(key[:2], 0) for key in x_keys])
+    m.setAttr('UB', x_vars, [1 if key[:2] in usable else 0 for key in x_keys])
+
+    arcs = list(m._start_times.keys())
+    m.setAttr('RHS', [m._start_times[arc] for arc in arcs],
+              [BigM - tt[arc] if arc in usable else GRB.INFINITY for arc in arcs])
+
+    for (i, s), constr in m._pickup_order.items():
+        m.chgCoeff(constr, Y[i], data['A'][i,s])
+
+    schools = list(m._latest.keys())
+    m.setAttr('RHS', [m._latest[s] for s in schools], [data['latest'][s] for s in schools])
+    m.setAttr('RHS', [m._earliest[s] for s in schools], [data['earliest'][s] for s in schools])
+    m.update()
+
+def decode_node_orders(positions):
+    """Turn the Y values of many solutions (one row each, the position of every non-depot node) into visiting orders.
+
+    Returns:
+    --------
+    tuple of (numpy.ndarray, numpy.ndarray)
+        The node orders, one row of node IDs per solution starting with the depot, and a boolean mask of the rows
+        whose rounded positions are a permutation. Rows that are not (the route would have gaps) are left as zeros.
+    """
+    positions = np.rint(np.atleast_2d(positions)).astype(int)
+    n_solutions, n = positions.shape
+    valid = np.all(np.sort(positions, axis=1) == np.arange(n), axis=1)
+    node_orders = np.zeros((n_solutions, n + 1), dtype=int)
+    rows = np.flatnonzero(valid)[:, None]
+    node_orders[rows, positions[valid] + 1] = np.arange(1, n + 1)
+    return node_orders, valid
+
+def decode_node_order(positions):
+    """ decode_node_orders for a single solution, returns None if it does not decode to a complete route """
+    node_orders, valid = decode_node_orders(positions)
+    return node_orders[0] if valid[0] else None
+
+def decode_routes(node_orders, coords):
+    """ Look up the (y, x) of every node in node_orders, returning a list of routes as lists of coordinate tuples """
+    points = np.array([coords[i] for i in range(len(coords))])[node_orders]
+    return [list(map(tuple, route)) for route in points.tolist()]
+
+def solution_arrays(m, max_routes=10):
+    """Read up to max_routes pool solutions of a solved model as integer arrays.
+
+    Returns:
+    --------
+    tuple of (numpy.ndarray, numpy.ndarray)
+        node_orders, the node IDs of every solution in visiting order (depot first), and arrivals, the matching arrival
+        times in seconds since midnight. Solutions that do not decode to a complete route are left out.
+    """
+    from gurobipy import GRB
+
+    y_vars, k_vars = list(m._Y.values()), list(m._K.values())
+    n_solutions = min(m.SolCount, max_routes)
+    positions = np.empty((n_solutions, len(y_vars)))
+    arrivals = np.empty((n_solutions, len(k_vars)))
+    for sol in range(n_solutions):
+        m.setParam(GRB.Param.SolutionNumber, sol)
+        positions[sol] = m.getAttr('Xn', y_vars)
+        arrivals[sol] = m.getAttr('Xn', k_vars)
+
+    node_orders, valid = decode_node_orders(positions)
+    node_orders = node_orders[valid]
+    arrivals = np.rint(np.take_along_axis(arrivals[valid], node_orders, axis=1)).astype(np.int64)
+    return node_orders, arrivals
+
+def get_feasible_routes(num_students, num_schools, start_times, travel_time, coords, max_routes=10, choices=None,
+                        as_arrays=False):
+    """Solve the routing MIP and return up to max_routes solutions from the solution pool.
+
+    travel_time is either the dense (n+1) x (n+1) array from travel_times.calculate_travel_times or a sparse
+    {(i, j): seconds} dict over candidate_arcs, in which case only those arcs get variables. choices (the school of
+    every student) is drawn at random if not given, it must be the one candidate_arcs was called with.
+
+    Returns routes as lists of coords and arrival times as HH:MM:SS strings, or with as_arrays=True the node_orders
+    and integer arrival seconds arrays from solution_arrays (format them with export.format_times for display).
+    """
+    from gurobipy import GRB
+
+    print('Setting up mixed-integer program...')
+    data = problem_data(num_students, num_schools, start_times, travel_time, choices)
+
+    print('Building model...')
+    m = build_model(num_students, num_schools, list(data['tt']))
+    set_model_data(m, data, max_routes)
 
     print('Optimizing...')
     m.optimize()
@@ -97,39 +322,106 @@ def get_feasible_routes(num_students, num_schools, start_times, travel_time, coo
     if status in [GRB.INF_OR_UNBD, GRB.INFEASIBLE, GRB.UNBOUNDED]:
         print("Model is either infeasible or unbounded.")
    
-    route_solutions = []
-    pickup_time_solutions = []
-    nSolutions = min(m.SolCount, max_routes)
-    for sol in range(nSolutions):
-        m.setParam(GRB.Param.SolutionNumber, sol)
-        values = m.Xn
-        num_vars = num_students + num_schools
-        ordering = list(map(lambda x: int(x), values[-(2*num_vars+1):-(num_vars+1)]))
-        cumulative_times_of_arrival = list(map(lambda x: int(x), values[-(num_vars+1):]))
-
-        #add depot
-        route = [1] * (len(ordering)+1)
-        route[0] = coords[0]
-        node_order = [0] * (len(ordering)+1)
-        for i in range(len(ordering)):
-             route[ordering[i]+1] = coords[i+1]
-             node_order[ordering[i]+1] = i+1
-
-        route_solutions.append(route)
-        
-        sorted_arrivals = sorted(cumulative_times_of_arrival)
-        time_strings = []
-        
-        for seconds in sorted_arrivals:
-            time_delta = timedelta(seconds=seconds)
-            time = (datetime(1900, 1, 1) + time_delta).time()
-            time_string = time.strftime("%H:%M:%S")
-            time_strings.append(time_string)
-        
-        pickup_time_solutions.append(time_strings)
-        
+    node_orders, arrivals = solution_arrays(m, max_routes)
     print('Optimization complete!')
-    return route_solutions, pickup_time_solutions
+    if as_arrays:
+        return node_orders, arrivals
+    return decode_routes(node_orders, coords), format_times(arrivals).tolist()
+
+def get_diverse_routes(num_students, num_schools, start_times, travel_time, coords, n_routes=10, choices=None,
+                       method='nogood', perturbation=0.05, time_limit=None, max_rounds=50, env=None, as_arrays=False):
+    """Generate up to n_routes routes with pairwise distinct node orderings.
+
+    Pool solutions are deduplicated by a hash of their node ordering as they come in (solutions that only differ in
+    arrival times count once), and solutions that do not decode to a complete route are dropped. Until enough unique
+    routes are found the model is re-solved, with method
+        'nogood': a cut excluding each ordering found so far, so every new solution has a new ordering
+        'perturb': travel time objective coefficients randomly scaled by up to +/- perturbation
+        None: no re-solves, only deduplicate the first pool
+
+    Parameters:
+    -----------
+    num_students, num_schools, start_times, travel_time, coords, choices :
+        As for get_feasible_routes.
+    n_routes : int, optional
+        Number of unique routes wanted. Default is 10.
+    time_limit : float, optional
+        Total solve time budget in seconds. Default is no limit.
+    max_rounds : int, optional
+        Maximum number of solves. Default is 50.
+    env : gurobipy.Env, optional
+        Environment to build the model in, e.g. from a batch_solver.SolverRunner.
+    as_arrays : bool, optional
+        Return node orders and integer arrival seconds arrays (as solution_arrays does) instead of coords and strings.
+
+    Returns:
+    --------
+    tuple of (list, list, dict)
+        The routes (lists of coords) and arrival time strings of the unique solutions, and stats with the number of
+        'unique', 'duplicates' and 'invalid' solutions, the 'rounds', the 'solve_seconds' and 'unique_per_second'.
+    """
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    if method not in ('nogood', 'perturb', None):
+        raise ValueError(f"method must be 'nogood', 'perturb' or None, got {method!r}")
+
+    data = problem_data(num_students, num_schools, start_times, travel_time, choices)
+    m = build_model(num_students, num_schools, list(data['tt']), env=env)
+    set_model_data(m, data, n_routes)
+    X, Y, K = m._X, m._Y, m._K
+    y_vars, k_vars = list(Y.values()), list(K.values())
+
+    unique = {} # node ordering bytes -> (node_order, arrival seconds)
+    stats = {'unique': 0, 'duplicates': 0, 'invalid': 0, 'rounds': 0, 'solve_seconds': 0.0}
+    while len(unique) < n_routes and stats['rounds'] < max_rounds:
+        if time_limit is not None:
+            if stats['solve_seconds'] >= time_limit:
+                break
+            m.Params.TimeLimit = time_limit - stats['solve_seconds']
+        m.Params.PoolSolutions = n_routes - len(unique)
+        m.optimize()
+        stats['rounds'] += 1
+        stats['solve_seconds'] += m.Runtime
+        if m.Status in [GRB.INF_OR_UNBD, GRB.INFEASIBLE, GRB.UNBOUNDED] or m.SolCount == 0:
+            break
+
+        for sol in range(m.SolCount):
+            m.Params.SolutionNumber = sol
+            node_order = decode_node_order(m.getAttr('Xn', y_vars))
+            if node_order is None:
+                stats['invalid'] += 1
+                continue
+            key = node_order.tobytes()
+            if key in unique:
+                stats['duplicates'] += 1
+                continue
+            unique[key] = (node_order, np.rint(np.array(m.getAttr('Xn', k_vars))[node_order]).astype(np.int64))
+            if method == 'nogood':
+                # at most n - 1 of the arcs (in the same positions) of this ordering may be used again
+                used = [X[node_order[o], node_order[o+1], o] for o in range(len(node_order) - 1)]
+                m.addConstr(gp.quicksum(used) <= len(used) - 1)
+            if len(unique) == n_routes:
+                break
+
+        if method is None:
+            break
+        if method == 'perturb':
+            x_keys = list(X.keys())
+            noise = 1 + perturbation * np.random.uniform(-1, 1, len(x_keys))
+            m.setAttr('Obj', [X[key] for key in x_keys], [data['tt'][key[:2]] * f for key, f in zip(x_keys, noise)])
+
+    stats['unique'] = len(unique)
+    stats['unique_per_second'] = len(unique) / stats['solve_seconds'] if stats['solve_seconds'] > 0 else 0.0
+    print(f"{stats['unique']} unique routes in {stats['solve_seconds']:.2f}s of solving "
+          f"({stats['unique_per_second']:.1f} unique routes/s, {stats['duplicates']} duplicates, {stats['invalid']} invalid)")
+
+    n = num_students + num_schools + 1
+    node_orders = np.array([node_order for node_order, _ in unique.values()], dtype=int).reshape(-1, n)
+    arrivals = np.array([arrival for _, arrival in unique.values()], dtype=np.int64).reshape(-1, n)
+    if as_arrays:
+        return node_orders, arrivals, stats
+    return decode_routes(node_orders, coords), format_times(arrivals).tolist(), stats
 
 
 if __name__ == "__main__":
@@ -142,7 +434,10 @@ if __name__ == "__main__":
     
     G = travel_times.generate_G(mode = 'bbox', location_data = (ymax, ymin, xmin, xmax))
     coords = travel_times.generate_random_coords(G, num_student_locations, num_schools, depot_coords=(40.7283, -73.94060))
-    travel_time = travel_times.calculate_travel_times(G, num_student_locations, num_schools, coords)
     starting_times = generate_start_times(num_schools)
-    routes, pickups = get_feasible_routes(num_student_locations, num_schools, starting_times, travel_time, coords)
+    choices = generate_school_choices(num_student_locations, num_schools)
+    arcs = candidate_arcs(num_student_locations, num_schools, starting_times, choices, coords,
+                          speed=travel_times.max_edge_speed(G))
+    travel_time = travel_times.calculate_travel_times(G, num_student_locations, num_schools, coords, arcs=arcs)
+    routes, pickups = get_feasible_routes(num_student_locations, num_schools, starting_times, travel_time, coords, choices=choices)
     print(routes, pickups)
\ No newline at end of file
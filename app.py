@@ -1,12 +1,19 @@
-import route_variables
 import travel_times
-from app_generate_plots import *
+from app_generate_plots import get_random_n_students, get_random_n_schools, generate_points, plot_points, \
+    generate_routes, create_coords_df, session_id, session_graph
+from session_store import store
 
 import streamlit as st
-import pandas as pd
 
 
 def _setup():
+    # mark this session as active, then free the memory of idle sessions (and the oldest ones if over the size bound)
+    store.touch(session_id())
+    evicted = store.evict_idle()
+    if evicted: # only report when memory was actually freed, not on every rerun
+        report = store.memory_report()
+        print(f"Session store: evicted {len(evicted)} sessions, {len(report) - 1} sessions left holding "
+              f"{sum(report.values()) - report['graphs']:,} bytes, {report['graphs']} shared graphs")
     if "n_students" not in st.session_state:
         get_random_n_students()
     if "n_schools" not in st.session_state:
@@ -112,8 +119,7 @@ def main():
                 generate_points(n_students, n_schools, mode, location_data, points_container)
             
             # download coords button
-            create_coords_df(st.session_state.coords)
-            data = st.session_state['coords_data'].to_csv(index=False).encode('utf-8')
+            data = create_coords_df(st.session_state.coords).to_csv(index=False).encode('utf-8')
             st.download_button("Download coordinates as csv",
                             data,
                             "coords.csv",
@@ -122,25 +128,30 @@ def main():
     
     # when "Generate Routes" is clicked:
     if generate:
-        if 'coords' in st.session_state: # check that coordinates have been generated first
+        G = session_graph()
+        if 'coords' in st.session_state and G is not None: # check that coordinates have been generated first
             if len(st.session_state['coords']) == (n_students + n_schools + 1):
                 with plots_container:
                             
                     # generate routes
-                    routes, start_time_solutions = generate_routes(G=st.session_state.G, 
-                                                                n_students=n_students, 
-                                                                n_schools=n_schools, 
-                                                                coords=st.session_state.coords, 
-                                                                max_routes=max_routes, 
-                                                                container=plots_container)
+                    node_orders, arrivals = generate_routes(G=G, 
+                                                            n_students=n_students, 
+                                                            n_schools=n_schools, 
+                                                            coords=st.session_state.coords, 
+                                                            max_routes=max_routes, 
+                                                            container=plots_container)
                     
                     
-                # reload the coords graph in section 3
+                # reload the coords graph in section 3, reusing the stored png if there is one
                 with points_container:
-                    plot_points(G=st.session_state.G,
-                                coords=st.session_state.coords,
-                                color_mapping=st.session_state.color_mapping, 
-                                container=points_container)
+                    points_png = store.get(session_id(), 'points_fig')
+                    if points_png is not None:
+                        points_container.image(points_png)
+                    else:
+                        plot_points(G=G,
+                                    coords=st.session_state.coords,
+                                    color_mapping=st.session_state.color_mapping, 
+                                    container=points_container)
                     create_coords_df(st.session_state.coords)
             else:
                 plots_container.warning('Please regenerate coordinates after updating parameters!')
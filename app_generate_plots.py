@@ -2,17 +2,28 @@ import route_variables
 import travel_times
 import plot2
 import MIP
+import export
+from session_store import store, fig_to_png
 
 import streamlit as st
-import osmnx as ox
 import numpy as np
 import pandas as pd
 
 import io
-import zipfile
+import uuid
 
 
 
+def session_id():
+    """ ID of the current browser session in the process-wide session store """
+    if 'session_id' not in st.session_state:
+        st.session_state['session_id'] = uuid.uuid4().hex
+    return st.session_state['session_id']
+
+def session_graph():
+    """ The shared graph of the current session, None if it has not been generated (or was evicted) """
+    return store.session_graph(session_id())
+
 def get_random_n_students():
     """ Randomly draws a new value for n_students """
     st.session_state["n_students"] = route_variables.random_n_students()
@@ -24,26 +35,27 @@ def get_random_n_schools():
     return
 
 def generate_points(n_students, n_schools, mode, location_data, container):
-    # generate graph and coordinates
-    G = travel_times.generate_G(mode, location_data)
+    # generate graph (shared with every session using the same location) and coordinates
+    G = store.get_graph(session_id(), (mode, location_data), lambda: travel_times.generate_G(mode, location_data))
     coords = travel_times.generate_random_coords(G, n_students, n_schools, depot_coords=(40.7283, -73.94060)) # (y, x)
     color_mapping = plot2.create_color_mapping(coords, n_students, n_schools)
-    # save graph and coordinates to st.session_state
+    # save coordinates to st.session_state, the graph is only referenced through the session store
     st.session_state['coords'] = coords
-    st.session_state['G'] = G
     st.session_state['color_mapping'] = color_mapping
     # plot graph and coordinates
     plot_points(G, coords, color_mapping, container)
     return
 
 def plot_points(G, coords, color_mapping, container):
+    import osmnx as ox
+
     fig, ax = ox.plot_graph(G)
     for node in coords:
         y, x = coords[node]
         ax.scatter(x=x, y=y, s=75, c=color_mapping[(y, x)])
-    # save the coordinate graph to session_state
-    st.session_state['points_fig'] = fig
-    container.pyplot(st.session_state.points_fig)
+    # save the coordinate graph to the session store as png
+    png = store.put_figure(session_id(), 'points_fig', fig)
+    container.image(png)
 
 
 def generate_routes(G, n_students, n_schools, coords, max_routes, container):
@@ -53,32 +65,36 @@ def generate_routes(G, n_students, n_schools, coords, max_routes, container):
     my_bar = container.progress(progress_value, text=progress_text)
     progress_value += 5
     
-    progress_text = 'Calculating travel times... (this may take a while!)'
-    my_bar.progress(progress_value, text=progress_text)
-    travel_time_table = travel_times.calculate_travel_times(G, n_students, n_schools, coords)
-    progress_value += 40
-
     progress_text = 'Getting start times...'
     my_bar.progress(progress_value, text=progress_text)
     starting_times = MIP.generate_start_times(n_schools)
+    choices = MIP.generate_school_choices(n_students, n_schools)
+    arcs = MIP.candidate_arcs(n_students, n_schools, starting_times, choices, coords,
+                              speed=travel_times.max_edge_speed(G))
     progress_value += 15
     
+    progress_text = 'Calculating travel times... (this may take a while!)'
+    my_bar.progress(progress_value, text=progress_text)
+    travel_time_table = travel_times.calculate_travel_times(G, n_students, n_schools, coords, arcs=arcs)
+    progress_value += 40
+    
     progress_text = 'Getting feasible routes...'
     my_bar.progress(progress_value, text=progress_text)
-    routes, start_time_solutions  = MIP.get_feasible_routes(n_students, n_schools, starting_times, travel_time_table, coords, max_routes)
+    # solutions stay as node ID / arrival second arrays, they are only formatted for display and export
+    node_orders, arrivals = MIP.get_feasible_routes(n_students, n_schools, starting_times, travel_time_table, coords,
+                                                    max_routes, choices=choices, as_arrays=True)
     progress_value += 20
-
-    # check for accidental infeasible routes (integers included in the route when they shouldn't be)
-    _routes = []
-    for route in routes:
-        print(route)
-        if all(isinstance(r, tuple) for r in route):
-            _routes.append(route)
-    routes = _routes
     
     progress_text = 'Plotting routes...'
     my_bar.progress(progress_value, text=progress_text)
-    plots = plot2.plot_our_routes(G, routes, st.session_state.color_mapping)
+    # plot every route, keeping only the ones with a path between each pair of stops
+    plots, kept = [], []
+    for i, route in enumerate(MIP.decode_routes(node_orders, coords)):
+        fig, ax = plot2.plot_our_route(G, route, st.session_state.color_mapping) # returns None, None if no path exists
+        if fig is not None:
+            plots.append(fig)
+            kept.append(i)
+    node_orders, arrivals = node_orders[kept], arrivals[kept]
     progress_value += 20
     
     progress_text = 'Done!'
@@ -88,15 +104,13 @@ def generate_routes(G, n_students, n_schools, coords, max_routes, container):
         container.write('Number of routes generated:')
         container.write(len(plots))
         
-        # download routes as zip
+        # plot routes
+        for i in range(len(plots)):
+            container.image(fig_to_png(plots[i])) # plot route
+            create_route_df(node_orders[i], arrivals[i], coords)
+        # write the routes into an in-memory zip (download_button holds the whole payload in memory anyway)
         buf = io.BytesIO()
-        with zipfile.ZipFile(buf, "x") as csv_zip:
-            # plot routes and write to zip
-            for i in range(len(plots)):
-                container.pyplot(plots[i]) # plot route
-                create_route_df(routes[i], start_time_solutions[i], coords)
-                csv_zip.writestr(f"route_{i+1}.csv", pd.DataFrame(st.session_state.route_data).to_csv())
-        # create download button
+        export.write_routes(buf, node_orders, arrivals, coords, fmt='zip')
         container.download_button(
             label="Download zip",
             data=buf.getvalue(),
@@ -107,38 +121,31 @@ def generate_routes(G, n_students, n_schools, coords, max_routes, container):
     else:
         container.write('No feasible routes found.')
         
-    return routes, start_time_solutions
+    return node_orders, arrivals
 
 
 def create_coords_df(coords):
-    # build a DataFrame of the coordinates and save to session_state
+    # build a DataFrame of the coordinates
     data = []
     for nodeid in coords:
         (y, x) = coords[nodeid]
         data.append([nodeid, y, x])
     data = pd.DataFrame(data, columns=['Node ID', 'Latitude (y)', 'Longitude (x)'])
     # data.index.name = 'Node ID'
-    st.session_state['coords_data'] = data
     
     # create an expandable tab with the coordinates of each point
     with st.expander('View coordinates'):
         st.dataframe(data, use_container_width=True)
+    return data
         
         
-def create_route_df(route, start_times, coords_mapping):
-    # first flip the coords_mapping from id:coords -> coords:id
-    coords_mapping = {v: k for k, v in coords_mapping.items()}
-    # build data
-    data = []
-    print('==== ROUTE', route)
-    print('---- TIMES', start_times)
-    for pair, t in zip(route, start_times):
-        print('==== pair, t', pair, t)
-        nodeid = coords_mapping[pair]
-        (y, x) = pair
-        data.append([nodeid, y, x, t])
-    data = pd.DataFrame(data, columns=['Node ID', 'Latitude (y)', 'Longitude (x)', 'Arrival Time'])
-    st.session_state['route_data'] = data
+def create_route_df(node_order, arrivals, coords_mapping):
+    # build data from the node IDs and arrival seconds along the route
+    points = np.array([coords_mapping[nodeid] for nodeid in node_order])
+    data = pd.DataFrame({'Node ID': node_order,
+                         'Latitude (y)': points[:, 0],
+                         'Longitude (x)': points[:, 1],
+                         'Arrival Time': export.format_times(arrivals)})
     
     # create an expandable tab with the coordinates/times of each route
     with st.expander('View coordinates'):
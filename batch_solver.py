@@ -0,0 +1,133 @@
+"""
+Batched solving of many routing scenarios.
+
+Every call to MIP.get_feasible_routes builds a fresh model in the default
+environment, which for small instances costs more than the solve itself. The
+SolverRunner instead keeps a pool of long-lived Gurobi environments (one per
+license seat / worker thread) and, per environment, one model skeleton per
+(n_students, n_schools) size. A scenario is solved by loading its data into the
+matching skeleton with MIP.set_model_data, which only touches coefficients,
+right hand sides and bounds.
+
+A scenario is a dict with the arguments of MIP.get_feasible_routes:
+    {'num_students': int, 'num_schools': int, 'start_times': list of str,
+     'travel_time': array or {(i, j): seconds} dict,
+     'choices': array (optional), 'max_routes': int (optional)}
+Solutions are returned as integer arrays (node orders and arrival seconds, see
+MIP.solution_arrays); decode them with MIP.decode_routes and export.format_times
+only when they are displayed or exported.
+"""
+import queue
+import threading
+import time
+
+import MIP
+
+
+class SolverRunner:
+    """A pool of Gurobi environments that solves a queue of scenarios.
+
+    Parameters:
+    -----------
+    n_envs : int, optional
+        Number of environments (and worker threads) to keep, at most one per available license seat. Default is 1.
+    threads : int, optional
+        Gurobi Threads parameter for every environment. Default is to let Gurobi decide.
+    max_routes : int, optional
+        Pool size used for scenarios that do not set 'max_routes'. Default is 10.
+    """
+
+    def __init__(self, n_envs=1, threads=None, max_routes=10):
+        import gurobipy as gp
+
+        self.max_routes = max_routes
+        self._envs = []
+        for _ in range(n_envs):
+            env = gp.Env(empty=True)
+            env.setParam('OutputFlag', 0)
+            if threads is not None:
+                env.setParam('Threads', threads)
+            env.start()
+            self._envs.append(env)
+        self._models = [{} for _ in self._envs] # per environment: (n_students, n_schools) -> model skeleton
+        self.stats = {}
+
+    def _model(self, worker, num_students, num_schools):
+        """ The skeleton for this size in the worker's environment, built over every arc on first use """
+        key = (num_students, num_schools)
+        models = self._models[worker]
+        if key not in models:
+            L = range(num_students + num_schools + 1)
+            arcs = [(i, j) for i in L for j in L if i != j]
+            models[key] = MIP.build_model(num_students, num_schools, arcs, env=self._envs[worker])
+        return models[key]
+
+    def solve(self, scenario, worker=0):
+        """ Solve a single scenario and return its (node_orders, arrivals) arrays, see MIP.solution_arrays """
+        num_students, num_schools = scenario['num_students'], scenario['num_schools']
+        max_routes = scenario.get('max_routes', self.max_routes)
+        data = MIP.problem_data(num_students, num_schools, scenario['start_times'], scenario['travel_time'],
+                                scenario.get('choices'))
+        m = self._model(worker, num_students, num_schools)
+        MIP.set_model_data(m, data, max_routes)
+        m.optimize()
+        return MIP.solution_arrays(m, max_routes)
+
+    def run(self, scenarios):
+        """Solve every scenario, spreading them over the environments.
+
+        Returns:
+        --------
+        list
+            The (node_orders, arrivals) of each scenario, in the order given. Throughput is stored in self.stats as
+            {'scenarios', 'seconds', 'scenarios_per_second'}.
+        """
+        scenarios = list(scenarios)
+        results = [None] * len(scenarios)
+        errors = []
+        todo = queue.Queue()
+        for item in enumerate(scenarios):
+            todo.put(item)
+
+        def work(worker):
+            while True:
+                try:
+                    index, scenario = todo.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[index] = self.solve(scenario, worker)
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=work, args=(w,)) for w in range(len(self._envs))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+        self.stats = {'scenarios': len(scenarios), 'seconds': elapsed,
+                      'scenarios_per_second': len(scenarios) / elapsed if elapsed > 0 else float('inf')}
+        print(f"Solved {len(scenarios)} scenarios in {elapsed:.2f}s ({self.stats['scenarios_per_second']:.1f} scenarios/s)")
+        return results
+
+    def close(self):
+        """ Free the model skeletons and release the environments (and their licenses) """
+        for models in self._models:
+            for m in models.values():
+                m.dispose()
+            models.clear()
+        for env in self._envs:
+            env.dispose()
+        self._envs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,420 @@
+"""
+Benchmarks for the route generation pipeline.
+
+Times each stage of the pipeline (travel time matrix, MIP, route plotting and
+csv/zip export) on saved fixture graphs so that no Overpass/Nominatim access is
+needed, sweeping over the number of students and schools. The synthetic street
+grid fixture is committed, the neighborhood fixtures are downloaded once with
+--save-fixtures. Results are compared against a stored baseline and any stage
+that got slower than the tolerance allows is flagged as a regression. Timings
+are machine-specific, so no baseline is committed: create one with
+--update-baseline first, without one the comparison exits with status 2.
+
+Usage:
+    python benchmark.py --save-fixtures      # one-time download of the neighborhood fixture graphs (needs network)
+    python benchmark.py --update-baseline    # run the sweep and store the results as this machine's baseline
+    python benchmark.py                      # run the sweep and compare against the baseline
+    python benchmark.py --full               # sweep every n_students in 2-22 and n_schools in 1-7 (slow, beyond ~12 stops the
+                                             # MIP needs a full Gurobi license)
+    python benchmark.py --stages importtime  # only track cold import times (python -X importtime)
+    python benchmark.py --stages decode      # only compare per-stop Python decoding with the vectorized decoding
+
+The sparse_* stages compute travel times and build the MIP only over MIP.candidate_arcs. The MIP stages are skipped
+when no Gurobi license is available.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_fixtures')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# fixture graphs, {name: (mode, location_data)} as passed to travel_times.generate_G for NYC neighborhoods that are
+# downloaded by --save-fixtures, or None for the synthetic street grid that is committed to benchmark_fixtures/ so the
+# benchmarks run on a clean checkout without network access
+FIXTURES = {
+    'grid': None,
+    'greenpoint': ('name', ('Greenpoint, New York', 1000)),
+    'williamsburg': ('bbox', (40.7303, 40.7063, -73.92860, -73.96260)),
+    'bushwick': ('bbox', (40.708213, 40.662075, -73.961004, -73.906759)),
+}
+
+DEPOT_COORDS = (40.7283, -73.94060)
+STAGES = ['travel_times', 'mip', 'sparse_travel_times', 'sparse_mip', 'plot', 'export', 'importtime', 'decode']
+
+# modules that batch jobs import, these must not pull in any of HEAVY_MODULES at import time
+HEADLESS_MODULES = ['route_variables', 'travel_times', 'MIP', 'export', 'batch_solver', 'local_osm']
+APP_MODULES = ['plot2', 'session_store', 'app_generate_plots']
+HEAVY_MODULES = ['streamlit', 'matplotlib', 'osmnx', 'taxicab', 'gurobipy', 'pandas']
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURE_DIR, f'{name}.graphml')
+
+
+def synthetic_grid(n_avenues=9, n_streets=26, seed=0):
+    """Build a street grid shaped like a ~2 x 2 km osmnx drive graph of Brooklyn around DEPOT_COORDS.
+
+    Avenues (~250 m apart) are two-way at 40 km/h, streets (~80 m apart) are one-way at 25 km/h with alternating
+    directions, and intersections are jittered by a few meters. Edges have the length, speed_kph and travel_time
+    attributes of ox.add_edge_speeds/add_edge_travel_times.
+    """
+    import networkx as nx
+
+    rng = np.random.RandomState(seed)
+    lat0 = DEPOT_COORDS[0] - (n_streets - 1) * 0.0007 / 2
+    lng0 = DEPOT_COORDS[1] - (n_avenues - 1) * 0.003 / 2
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    for r in range(n_streets):
+        for c in range(n_avenues):
+            G.add_node(r * n_avenues + c, y=lat0 + r * 0.0007 + rng.uniform(-3e-5, 3e-5),
+                       x=lng0 + c * 0.003 + rng.uniform(-3e-5, 3e-5))
+
+    def add_street(u, v, highway, speed):
+        (y1, x1), (y2, x2) = [np.radians((G.nodes[n]['y'], G.nodes[n]['x'])) for n in (u, v)]
+        a = np.sin((y2 - y1) / 2)**2 + np.cos(y1) * np.cos(y2) * np.sin((x2 - x1) / 2)**2
+        length = float(2 * 6371009 * np.arcsin(np.sqrt(a)))
+        G.add_edge(u, v, highway=highway, length=length, speed_kph=float(speed), travel_time=length / (speed / 3.6))
+
+    for r in range(n_streets):
+        for c in range(n_avenues):
+            node = r * n_avenues + c
+            if r + 1 < n_streets: # avenue block, both directions
+                add_street(node, node + n_avenues, 'secondary', 40)
+                add_street(node + n_avenues, node, 'secondary', 40)
+            if c + 1 < n_avenues: # street block, one way
+                if r % 2 == 0:
+                    add_street(node, node + 1, 'residential', 25)
+                else:
+                    add_street(node + 1, node, 'residential', 25)
+    return G
+
+
+def save_fixtures(names=None):
+    """ Save the fixture graphs as GraphML so the benchmarks can run offline, downloading the neighborhood ones """
+    import osmnx as ox
+    import travel_times
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name in (names or FIXTURES):
+        if FIXTURES[name] is None:
+            print(f'Building fixture {name}...')
+            G = synthetic_grid()
+        else:
+            mode, location_data = FIXTURES[name]
+            print(f'Downloading fixture {name}...')
+            G = travel_times.generate_G(mode, location_data)
+        ox.save_graphml(G, fixture_path(name))
+
+
+def saved_fixtures():
+    """ Names of the fixtures that have been saved """
+    return [name for name in FIXTURES if os.path.exists(fixture_path(name))]
+
+
+def load_fixture(name):
+    """ Load a saved fixture graph, raises FileNotFoundError if it has not been saved yet """
+    import osmnx as ox
+
+    path = fixture_path(name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'missing fixture {path}, run `python benchmark.py --save-fixtures` first')
+    return ox.load_graphml(path)
+
+
+def gurobi_available():
+    """ Check whether gurobipy is installed and a license can be checked out """
+    try:
+        import gurobipy as gp
+    except ImportError:
+        return False
+    try:
+        with gp.Env(empty=True) as env:
+            env.setParam('OutputFlag', 0)
+            env.start()
+        return True
+    except gp.GurobiError:
+        return False
+
+
+def sweep_cases(full=False):
+    """ (n_students, n_schools) pairs to benchmark, every school needs at least one student """
+    if full:
+        students, schools = range(2, 23), range(1, 8)
+    else:
+        # the MIP solve time grows steeply with the size (~30s for 8 students on the grid fixture, minutes with
+        # more schools), keep the default sweep to sizes that finish in seconds
+        students, schools = range(2, 7, 2), range(1, 4)
+    return [(n, k) for n in students for k in schools if k <= n]
+
+
+def _timed(repeat, func, *args, **kwargs):
+    """ Run func repeat times and return (best time in seconds, result of the last run) """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()): # silence the pipeline's progress prints
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+    return best, result
+
+
+def random_solutions(n_solutions, n_stops):
+    """Stand-in solver output for when the MIP is skipped or for the decode benchmark.
+
+    Returns:
+    --------
+    tuple of (numpy.ndarray, numpy.ndarray)
+        The Y values (position of every non-depot node) and the K values (arrival seconds of every node) of each
+        solution, with arrival times increasing along the route.
+    """
+    positions = np.argsort(np.random.rand(n_solutions, n_stops - 1), axis=1).astype(float)
+    legs = np.random.randint(60, 600, size=(n_solutions, n_stops))
+    legs[:, 0] = 6.5 * 3600
+    arrivals_in_order = np.cumsum(legs, axis=1)
+    arrivals = np.empty_like(arrivals_in_order)
+    arrivals[:, 0] = arrivals_in_order[:, 0]
+    # node j + 1 is visited at position positions[j] + 1
+    np.put_along_axis(arrivals[:, 1:], np.arange(n_stops - 1)[None, :].repeat(n_solutions, 0),
+                      np.take_along_axis(arrivals_in_order[:, 1:], positions.astype(int), axis=1), axis=1)
+    return positions, arrivals.astype(float)
+
+
+def decode_per_stop(positions, arrivals, coords):
+    """ The decoding the app did before it switched to arrays: per-stop loops, strftime and a coords inversion per route """
+    from datetime import datetime, timedelta
+
+    rows = []
+    for y_values, k_values in zip(positions, arrivals):
+        ordering = list(map(lambda x: int(x), y_values))
+        route = [1] * (len(ordering)+1)
+        route[0] = coords[0]
+        for i in range(len(ordering)):
+            route[ordering[i]+1] = coords[i+1]
+        time_strings = []
+        for seconds in sorted(map(lambda x: int(x), k_values)):
+            time = (datetime(1900, 1, 1) + timedelta(seconds=seconds)).time()
+            time_strings.append(time.strftime("%H:%M:%S"))
+        ids = {v: k for k, v in coords.items()}
+        rows.append([(ids[pair], pair, t) for pair, t in zip(route, time_strings)])
+    return rows
+
+
+def decode_vectorized(positions, arrivals, coords):
+    """ Decode solutions the way MIP.solution_arrays does, formatting the times only once at the end """
+    import MIP
+    import export
+
+    node_orders, valid = MIP.decode_node_orders(positions)
+    node_orders = node_orders[valid]
+    seconds = np.rint(np.take_along_axis(arrivals[valid], node_orders, axis=1)).astype(np.int64)
+    points = np.array([coords[i] for i in range(len(coords))])[node_orders]
+    return node_orders, points, export.format_times(seconds)
+
+
+def import_time(module, repeat=1):
+    """Measure the cold import time of a module in a fresh interpreter with `python -X importtime`.
+
+    Returns:
+    --------
+    tuple of (float, list)
+        The best cumulative import time of the module (in seconds) over repeat fresh interpreters and the names of
+        HEAVY_MODULES it imported, or (None, []) if the module cannot be imported in this environment.
+    """
+    code = f'import sys, {module}; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    best, heavy = None, []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        if proc.returncode != 0:
+            return None, []
+        # stderr lines look like "import time:      self [us] |  cumulative | imported package"
+        for line in proc.stderr.splitlines():
+            fields = [f.strip() for f in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                cumulative = int(fields[1]) / 1e6
+                best = cumulative if best is None else min(best, cumulative)
+        heavy = [m for m in proc.stdout.strip().split(',') if m]
+    return best, heavy
+
+
+def run_case(G, n_students, n_schools, stages, repeat=1, max_routes=5, seed=0):
+    """Benchmark every stage of the pipeline for one fixture graph and problem size.
+
+    Returns:
+    --------
+    dict
+        A dictionary mapping stage names to their best time (in seconds), stages that were skipped are left out.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import travel_times
+    import MIP
+    import plot2
+    import export
+
+    np.random.seed(seed)
+    coords = travel_times.generate_random_coords(G, n_students, n_schools, depot_coords=DEPOT_COORDS)
+    color_mapping = plot2.create_color_mapping(coords, n_students, n_schools)
+    start_times = MIP.generate_start_times(n_schools)
+    choices = MIP.generate_school_choices(n_students, n_schools)
+    timings = {}
+
+    node_orders, arrivals = None, None
+    if 'travel_times' in stages or 'mip' in stages:
+        t, travel_time = _timed(repeat, travel_times.calculate_travel_times, G, n_students, n_schools, coords)
+        if 'travel_times' in stages:
+            timings['travel_times'] = t
+        if 'mip' in stages:
+            timings['mip'], (node_orders, arrivals) = _timed(repeat, MIP.get_feasible_routes, n_students, n_schools,
+                                                            start_times, travel_time, coords, max_routes,
+                                                            choices=choices, as_arrays=True)
+
+    if 'sparse_travel_times' in stages or 'sparse_mip' in stages:
+        def sparse_travel_times():
+            arcs = MIP.candidate_arcs(n_students, n_schools, start_times, choices, coords,
+                                      speed=travel_times.max_edge_speed(G))
+            return travel_times.calculate_travel_times(G, n_students, n_schools, coords, arcs=arcs)
+        t, travel_time = _timed(repeat, sparse_travel_times)
+        if 'sparse_travel_times' in stages:
+            timings['sparse_travel_times'] = t
+        if 'sparse_mip' in stages:
+            timings['sparse_mip'], (node_orders, arrivals) = _timed(repeat, MIP.get_feasible_routes, n_students,
+                                                                   n_schools, start_times, travel_time, coords,
+                                                                   max_routes, choices=choices, as_arrays=True)
+
+    if node_orders is None or len(node_orders) == 0:
+        positions, k_values = random_solutions(max_routes, len(coords))
+        node_orders, _ = MIP.decode_node_orders(positions)
+        arrivals = np.take_along_axis(k_values, node_orders, axis=1).astype(np.int64)
+    routes = MIP.decode_routes(node_orders, coords)
+
+    if 'plot' in stages:
+        def plot():
+            figs = plot2.plot_our_routes(G, routes, color_mapping)
+            for fig in figs:
+                plt.close(fig)
+        timings['plot'], _ = _timed(repeat, plot)
+
+    if 'export' in stages:
+        def export_zip():
+            with tempfile.TemporaryFile() as f:
+                export.write_routes(f, node_orders, arrivals, coords, fmt='zip')
+        timings['export'], _ = _timed(repeat, export_zip)
+
+    return timings
+
+
+def run_benchmarks(fixtures, cases, stages, repeat=1):
+    """ Run the sweep and return a flat {"fixture/stage/n_students/n_schools": seconds} dict """
+    if any(s in stages for s in ('mip', 'sparse_mip')) and not gurobi_available():
+        print('No Gurobi license found, skipping the mip stages.')
+        stages = [s for s in stages if s not in ('mip', 'sparse_mip')]
+
+    results = {}
+    if 'importtime' in stages:
+        for module in HEADLESS_MODULES + APP_MODULES:
+            t, heavy = import_time(module, repeat)
+            key = f'importtime/{module}'
+            if t is None:
+                print(f'\t{key}: skipped, {module} cannot be imported here')
+                continue
+            results[key] = t
+            print(f'\t{key}: {t:.3f}s' + (f' (imports {", ".join(heavy)})' if heavy else ''))
+            if module in HEADLESS_MODULES and heavy:
+                print(f'WARNING {module} is not headless, it imports {", ".join(heavy)}')
+        stages = [s for s in stages if s != 'importtime']
+    if 'decode' in stages:
+        # 10k solutions of the largest instance (22 students, 7 schools), no graph needed
+        np.random.seed(0)
+        n_stops = 22 + 7 + 1
+        positions, arrivals = random_solutions(10000, n_stops)
+        coords = {i: (40.7 + np.random.rand() / 100, -73.95 + np.random.rand() / 100) for i in range(n_stops)}
+        for key, func in [('decode/per_stop', decode_per_stop), ('decode/vectorized', decode_vectorized)]:
+            results[key], _ = _timed(repeat, func, positions, arrivals, coords)
+            print(f'\t{key}: {results[key]:.3f}s')
+        stages = [s for s in stages if s != 'decode']
+    if not stages:
+        return results
+
+    for name in fixtures:
+        G = load_fixture(name)
+        for n_students, n_schools in cases:
+            timings = run_case(G, n_students, n_schools, stages, repeat=repeat)
+            for stage, t in timings.items():
+                key = f'{name}/{stage}/{n_students}/{n_schools}'
+                results[key] = t
+                print(f'\t{key}: {t:.3f}s')
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, min_delta=0.01):
+    """Return the keys whose time exceeds the baseline by more than tolerance (as a fraction).
+
+    Slowdowns of less than min_delta seconds are timer noise and never count as a regression, whatever their ratio.
+    """
+    regressions = []
+    for key, t in results.items():
+        if key in baseline and t > baseline[key] * (1 + tolerance) and t - baseline[key] >= min_delta:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the route generation pipeline on offline fixture graphs.')
+    parser.add_argument('--save-fixtures', action='store_true', help='download and save the fixture graphs, then exit')
+    parser.add_argument('--fixtures', nargs='+', choices=list(FIXTURES),
+                        help='fixture graphs to run on, default is every saved one')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--full', action='store_true', help='sweep the full n_students/n_schools grid')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best time is kept')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs. the baseline (fraction)')
+    parser.add_argument('--min-delta', type=float, default=0.01,
+                        help='ignore slowdowns smaller than this many seconds (timer noise)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    if args.save_fixtures:
+        save_fixtures(args.fixtures)
+        return 0
+
+    fixtures = args.fixtures or saved_fixtures()
+    print(f"Fixtures: {', '.join(fixtures)}")
+    results = run_benchmarks(fixtures, sweep_cases(args.full), args.stages, repeat=args.repeat)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Saved baseline to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, nothing to compare against. Timings are machine-specific, run with '
+              f'--update-baseline on this machine first.')
+        return 2
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, args.tolerance, args.min_delta)
+    for key in regressions:
+        print(f'REGRESSION {key}: {results[key]:.3f}s vs. baseline {baseline[key]:.3f}s')
+    if regressions:
+        return 1
+    print('No regressions.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
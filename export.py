@@ -0,0 +1,283 @@
+"""
+Streaming export of generated routes.
+
+Routes are written one at a time as node ID orderings plus arrival times, so a
+batch of any size can be exported with constant memory: nothing is kept after a
+route has been written except (for Parquet) a bounded buffer of rows. This only
+holds when writing to a path or an on-disk file, the app's download button gets
+the whole archive as bytes.
+
+Supported formats (picked from the file extension, or given explicitly):
+- zip: one csv per route, same layout as the app's "Download zip" button
+- geojson: a FeatureCollection with a Point feature per stop and a LineString feature per leg
+- parquet: one row per stop, arrival times as time32 columns (needs pyarrow)
+"""
+import csv
+import io
+import itertools
+import json
+import os
+import zipfile
+
+import numpy as np
+
+
+FORMATS = {'.zip': 'zip', '.geojson': 'geojson', '.json': 'geojson', '.parquet': 'parquet'}
+CSV_COLUMNS = ['', 'Node ID', 'Latitude (y)', 'Longitude (x)', 'Arrival Time']
+
+
+def format_seconds(seconds):
+    """ Format a number of seconds since midnight as an HH:MM:SS string """
+    seconds = int(seconds) % 86400
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+
+def format_times(seconds):
+    """Format an array (of any shape) of seconds since midnight as HH:MM:SS strings, without a Python-level loop.
+
+    Returns:
+    --------
+    numpy.ndarray
+        A '<U8' array of the same shape as seconds.
+    """
+    seconds = np.asarray(seconds, dtype=np.int64) % 86400
+    h, m, s = seconds // 3600, seconds % 3600 // 60, seconds % 60
+    # write the ASCII codes of the 8 characters side by side, then reinterpret every row as one 8-byte string
+    chars = np.empty(seconds.shape + (8,), dtype=np.uint8)
+    chars[..., 0], chars[..., 1] = h // 10, h % 10
+    chars[..., 3], chars[..., 4] = m // 10, m % 10
+    chars[..., 6], chars[..., 7] = s // 10, s % 10
+    chars += ord('0')
+    chars[..., 2] = chars[..., 5] = ord(':')
+    return chars.view('S8')[..., 0].astype('U8')
+
+
+def to_seconds(t):
+    """ Convert an HH:MM:SS string (or a number of seconds) to an int number of seconds since midnight """
+    if isinstance(t, str):
+        h, m, s = t.split(':')
+        return int(h) * 3600 + int(m) * 60 + int(s)
+    return int(t)
+
+
+def to_seconds_array(times):
+    """ Convert a sequence of seconds (or HH:MM:SS strings) to an int64 array of seconds since midnight """
+    times = np.asarray(times)
+    if times.dtype.kind in 'iuf':
+        return times.astype(np.int64)
+    return np.array([to_seconds(t) for t in times], dtype=np.int64)
+
+
+def node_orders_from_routes(routes, coords):
+    """ Convert routes given as lists of (y, x) tuples to lists of node IDs, inverting coords only once """
+    ids = {v: k for k, v in coords.items()}
+    return [[ids[pair] for pair in route] for route in routes]
+
+
+def leg_geometry(G, leg):
+    """Convert a taxicab shortest path into a list of (y, x) points running from the origin to the destination.
+
+    Parameters:
+    -----------
+    G : networkx.MultiDiGraph
+        The road network the path was computed on.
+    leg : tuple
+        The (route_length, nodes, first_segment, last_segment) tuple returned by taxicab's shortest_path.
+
+    Returns:
+    --------
+    list of tuple
+        The (y, x) points along the leg.
+    """
+    _, nodes, first_segment, last_segment = leg
+    points = []
+    # the tail end of each segment is the last item in its coords list, so the first segment runs backwards
+    if first_segment != []:
+        points.extend((y, x) for x, y in reversed(first_segment.coords))
+    points.extend((G.nodes[n]['y'], G.nodes[n]['x']) for n in nodes)
+    if last_segment != []:
+        points.extend((y, x) for x, y in last_segment.coords)
+    return points
+
+
+class RouteWriter:
+    """Base class for the streaming route writers.
+
+    Parameters:
+    -----------
+    f : str or file-like
+        Path (or open binary file) to write to.
+    coords : dict
+        Mapping of node IDs to (y, x) tuples, of the form {depot, students..., schools...}.
+    """
+
+    def __init__(self, f, coords):
+        self._coords = np.array([coords[i] for i in range(len(coords))], dtype=float)
+        self._own_file = isinstance(f, (str, os.PathLike))
+        self._file = open(f, 'wb') if self._own_file else f
+        self.n_routes = 0
+
+    def write(self, node_order, arrival_times, legs=None):
+        """Write a single route.
+
+        Parameters:
+        -----------
+        node_order : sequence of int
+            Node IDs in the order they are visited, starting at the depot.
+        arrival_times : sequence of int or str
+            Arrival time at each stop, as seconds since midnight or HH:MM:SS strings.
+        legs : list, optional
+            The (y, x) points of each leg (len(node_order) - 1 of them), see leg_geometry. Straight lines between the
+            stops are used if not given.
+        """
+        node_order = np.asarray(node_order, dtype=int)
+        points = self._coords[node_order]
+        seconds = to_seconds_array(arrival_times)
+        if legs is None:
+            legs = [[tuple(points[k-1]), tuple(points[k])] for k in range(1, len(points))]
+        self._write_route(self.n_routes, node_order, points, seconds, legs)
+        self.n_routes += 1
+
+    def _write_route(self, route_id, node_order, points, seconds, legs):
+        raise NotImplementedError
+
+    def close(self):
+        if self._own_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ZipRouteWriter(RouteWriter):
+    """ Writes one csv per route into a zip archive, each csv is streamed straight into the archive """
+
+    def __init__(self, f, coords):
+        super().__init__(f, coords)
+        self._zip = zipfile.ZipFile(self._file, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _write_route(self, route_id, node_order, points, seconds, legs):
+        with self._zip.open(f'route_{route_id+1}.csv', 'w') as raw:
+            text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(CSV_COLUMNS)
+            for k, (node, (y, x), t) in enumerate(zip(node_order, points, format_times(seconds))):
+                writer.writerow([k, node, y, x, t])
+            text.flush()
+            text.detach()
+
+    def close(self):
+        self._zip.close()
+        super().close()
+
+
+class GeoJSONRouteWriter(RouteWriter):
+    """ Writes a GeoJSON FeatureCollection, features are serialized as soon as each route is written """
+
+    def __init__(self, f, coords):
+        super().__init__(f, coords)
+        self._file.write(b'{"type": "FeatureCollection", "features": [\n')
+        self._first = True
+
+    def _write_feature(self, geometry, properties):
+        feature = {'type': 'Feature', 'geometry': geometry, 'properties': properties}
+        prefix = b'' if self._first else b',\n'
+        self._file.write(prefix + json.dumps(feature).encode('utf-8'))
+        self._first = False
+
+    def _write_route(self, route_id, node_order, points, seconds, legs):
+        for k, (node, (y, x), t) in enumerate(zip(node_order, points, format_times(seconds))):
+            self._write_feature({'type': 'Point', 'coordinates': [x, y]},
+                                {'route': route_id, 'stop': k, 'node_id': int(node),
+                                 'arrival_time': str(t)})
+        for k, leg in enumerate(legs):
+            self._write_feature({'type': 'LineString', 'coordinates': [[x, y] for y, x in leg]},
+                                {'route': route_id, 'leg': k, 'from': int(node_order[k]), 'to': int(node_order[k+1])})
+
+    def close(self):
+        self._file.write(b'\n]}\n')
+        super().close()
+
+
+class ParquetRouteWriter(RouteWriter):
+    """ Writes one row per stop to a Parquet file, flushing a row group every batch_size rows """
+
+    def __init__(self, f, coords, batch_size=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Parquet export requires pyarrow, install it with `pip install pyarrow`')
+        super().__init__(f, coords)
+        self._pa = pa
+        self._schema = pa.schema([
+            ('route', pa.int32()),
+            ('stop', pa.int32()),
+            ('node_id', pa.int32()),
+            ('latitude', pa.float64()),
+            ('longitude', pa.float64()),
+            ('arrival_time', pa.time32('s')),
+            ('leg', pa.list_(pa.list_(pa.float64(), 2))), # (x, y) points of the leg ending at this stop
+        ])
+        self._writer = pq.ParquetWriter(self._file, self._schema)
+        self._batch_size = batch_size
+        self._rows = {name: [] for name in self._schema.names}
+
+    def _write_route(self, route_id, node_order, points, seconds, legs):
+        n = len(node_order)
+        self._rows['route'].extend([route_id] * n)
+        self._rows['stop'].extend(range(n))
+        self._rows['node_id'].extend(node_order.tolist())
+        self._rows['latitude'].extend(points[:, 0].tolist())
+        self._rows['longitude'].extend(points[:, 1].tolist())
+        self._rows['arrival_time'].extend(seconds.tolist())
+        self._rows['leg'].append(None) # nothing leads into the depot
+        self._rows['leg'].extend([[x, y] for y, x in leg] for leg in legs)
+        if len(self._rows['route']) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows['route']:
+            self._writer.write_table(self._pa.Table.from_pydict(self._rows, schema=self._schema))
+            self._rows = {name: [] for name in self._schema.names}
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        super().close()
+
+
+WRITERS = {'zip': ZipRouteWriter, 'geojson': GeoJSONRouteWriter, 'parquet': ParquetRouteWriter}
+
+
+def open_route_writer(f, coords, fmt=None):
+    """ Open a RouteWriter for f, the format is taken from the file extension unless fmt is given """
+    if fmt is None:
+        if not isinstance(f, (str, os.PathLike)):
+            raise ValueError('fmt must be given when writing to a file object')
+        ext = os.path.splitext(str(f))[1].lower()
+        if ext not in FORMATS:
+            raise ValueError(f'unsupported export format {ext!r}, expected one of {sorted(FORMATS)}')
+        fmt = FORMATS[ext]
+    if fmt not in WRITERS:
+        raise ValueError(f'unsupported export format {fmt!r}, expected one of {sorted(WRITERS)}')
+    return WRITERS[fmt](f, coords)
+
+
+def write_routes(f, node_orders, arrival_times, coords, legs=None, fmt=None):
+    """Write a batch of routes, node_orders/arrival_times/legs may be generators to keep memory constant.
+
+    Returns:
+    --------
+    int
+        The number of routes written.
+    """
+    if legs is None:
+        legs = itertools.repeat(None)
+    with open_route_writer(f, coords, fmt) as writer:
+        for node_order, times, route_legs in zip(node_orders, arrival_times, legs):
+            writer.write(node_order, times, route_legs)
+    return writer.n_routes
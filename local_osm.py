@@ -0,0 +1,195 @@
+"""
+Offline stand-in for Overpass and Nominatim.
+
+Builds drive networks from a pre-downloaded OSM extract (.osm.pbf, or .osm XML)
+and answers address lookups from a local gazetteer, so graphs can be built
+without network access. Every region built from the extract is pickled to a
+cache directory and recorded in an index, so later requests inside a cached
+region only load and truncate the pickle.
+
+travel_times.generate_G uses a provider transparently once it is registered with
+travel_times.set_data_provider, or when the OSM_EXTRACT environment variable is
+set (see LocalOSMProvider.from_env).
+
+Reading .pbf extracts requires pyrosm.
+"""
+import csv
+import json
+import os
+import pickle
+import re
+from collections import OrderedDict
+
+
+# the way filter of osmnx's 'drive' network type (plus its default access filter), edges of .osm files with any of
+# these tag values are dropped. Tags that are not in ox.settings.useful_tags_way never reach the graph
+DRIVE_EXCLUDED = {
+    'highway': {'abandoned', 'bridleway', 'bus_guideway', 'construction', 'corridor', 'cycleway', 'elevator',
+                'escalator', 'footway', 'no', 'path', 'pedestrian', 'planned', 'platform', 'proposed', 'raceway',
+                'razed', 'service', 'steps', 'track'},
+    'area': {'yes'},
+    'access': {'private'},
+    'motor_vehicle': {'no'},
+    'motorcar': {'no'},
+    'service': {'alley', 'driveway', 'emergency_access', 'parking', 'parking_aisle', 'private'},
+}
+
+
+def is_drivable(data):
+    """ Whether an (unsimplified) edge's OSM tags pass the 'drive' filter: a highway that none of DRIVE_EXCLUDED rule out """
+    return 'highway' in data and not any(data.get(tag) in values for tag, values in DRIVE_EXCLUDED.items())
+
+
+def normalize_name(name):
+    """ Lowercase a place name and collapse punctuation/whitespace so gazetteer lookups are forgiving """
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name.lower()).split())
+
+
+class LocalOSMProvider:
+    """Drive networks and geocoding from local files.
+
+    Parameters:
+    -----------
+    extract_path : str
+        Path to the OSM extract covering every area that will be requested.
+    gazetteer_path : str, optional
+        CSV file with 'name', 'lat' and 'lon' columns used for address lookups.
+    cache_dir : str, optional
+        Directory for the pickled regions and their index. Regions are only kept in memory if not given.
+    margin : float, optional
+        Degrees added around every requested bbox when a new region is built, so nearby requests reuse it.
+        Default is 0.01 (about 1 km).
+    max_graphs : int, optional
+        Number of region graphs kept in memory. Default is 8.
+    """
+
+    def __init__(self, extract_path, gazetteer_path=None, cache_dir=None, margin=0.01, max_graphs=8):
+        self.extract_path = extract_path
+        self.cache_dir = cache_dir
+        self.margin = margin
+        self.max_graphs = max_graphs
+        self._graphs = OrderedDict() # region file name -> graph, in least to most recently used order
+
+        self.gazetteer = {}
+        if gazetteer_path is not None:
+            with open(gazetteer_path, newline='') as f:
+                for row in csv.DictReader(f):
+                    self.gazetteer[normalize_name(row['name'])] = (float(row['lat']), float(row['lon']))
+
+        # index of cached regions: [{'bbox': [north, south, east, west], 'file': name}, ...]
+        self.index = []
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(self._index_path()):
+                with open(self._index_path()) as f:
+                    self.index = json.load(f)
+
+    @classmethod
+    def from_env(cls):
+        """ Build a provider from OSM_EXTRACT, OSM_GAZETTEER and OSM_CACHE_DIR, returns None if OSM_EXTRACT is unset """
+        extract_path = os.environ.get('OSM_EXTRACT')
+        if not extract_path:
+            return None
+        return cls(extract_path, os.environ.get('OSM_GAZETTEER'), os.environ.get('OSM_CACHE_DIR'))
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, 'regions.json')
+
+    def geocode(self, query):
+        """ Return the (lat, lon) of a place name from the gazetteer, raises ValueError if it is not listed """
+        key = normalize_name(query)
+        if key not in self.gazetteer:
+            raise ValueError(f'{query!r} is not in the local gazetteer')
+        return self.gazetteer[key]
+
+    def find_region(self, north, south, east, west):
+        """ Return the smallest cached region containing the bbox, or None """
+        best = None
+        for region in self.index:
+            n, s, e, w = region['bbox']
+            if n >= north and s <= south and e >= east and w <= west:
+                if best is None or (n - s) * (e - w) < (best['bbox'][0] - best['bbox'][1]) * (best['bbox'][2] - best['bbox'][3]):
+                    best = region
+        return best
+
+    def _load_region(self, region):
+        """ Return a region's graph from memory or the cache directory, or None if it is in neither """
+        name = region['file']
+        if name in self._graphs:
+            self._graphs.move_to_end(name)
+            return self._graphs[name]
+        if self.cache_dir is None or not os.path.exists(os.path.join(self.cache_dir, name)):
+            return None
+        with open(os.path.join(self.cache_dir, name), 'rb') as f:
+            G = pickle.load(f)
+        self._remember(name, G)
+        return G
+
+    def _remember(self, name, G):
+        self._graphs[name] = G
+        while len(self._graphs) > self.max_graphs:
+            self._graphs.popitem(last=False)
+
+    def _build_region(self, north, south, east, west):
+        """Build the simplified drive network of a bbox from the extract, with edge speeds and travel times.
+
+        Like ox.graph_from_bbox(..., network_type='drive') the graph only has drivable ways, but it is not reduced to
+        its largest component yet, that is done after graph_from_bbox truncates it.
+        """
+        import networkx as nx
+        import osmnx as ox
+
+        if self.extract_path.endswith('.pbf'):
+            try:
+                import pyrosm
+            except ImportError:
+                raise ImportError('reading .pbf extracts requires pyrosm, install it with `pip install pyrosm`')
+            osm = pyrosm.OSM(self.extract_path, bounding_box=[west, south, east, north])
+            nodes, edges = osm.get_network(network_type='driving', nodes=True)
+            G = osm.to_graph(nodes, edges, graph_type='networkx', osmnx_compatible=True)
+            G = ox.simplify_graph(G)
+        else:
+            # graph_from_xml keeps every way, so filter to the drive network before simplifying
+            G = ox.graph_from_xml(self.extract_path, simplify=False, retain_all=True)
+            G = ox.truncate.truncate_graph_bbox(G, north, south, east, west, truncate_by_edge=True)
+            G.remove_edges_from([(u, v, k) for u, v, k, data in G.edges(keys=True, data=True) if not is_drivable(data)])
+            G.remove_nodes_from(list(nx.isolates(G)))
+            G = ox.simplify_graph(G)
+        G = ox.add_edge_speeds(G)
+        G = ox.add_edge_travel_times(G)
+        return G
+
+    def graph_from_bbox(self, north, south, east, west):
+        """Return the drive network of a bbox, with edge speeds and travel times.
+
+        The graph is cut from the smallest cached region containing the bbox, a new (padded) region is built from the
+        extract and cached if there is none. As with ox.graph_from_bbox only the largest (weakly) connected component
+        is kept, so no stop can be sampled on a disconnected island.
+        """
+        import networkx as nx
+        import osmnx as ox
+
+        region = self.find_region(north, south, east, west)
+        G = self._load_region(region) if region is not None else None
+        if G is None:
+            if region is not None: # dropped from memory and not on disk
+                self.index.remove(region)
+            bbox = [north + self.margin, south - self.margin, east + self.margin, west - self.margin]
+            G = self._build_region(*bbox)
+            name = 'region_{:.4f}_{:.4f}_{:.4f}_{:.4f}.pkl'.format(*bbox)
+            self._remember(name, G)
+            self.index.append({'bbox': bbox, 'file': name})
+            if self.cache_dir is not None:
+                with open(os.path.join(self.cache_dir, name), 'wb') as f:
+                    pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+                with open(self._index_path(), 'w') as f:
+                    json.dump(self.index, f, indent=2)
+        G = ox.truncate.truncate_graph_bbox(G, north, south, east, west, truncate_by_edge=True)
+        return G.subgraph(max(nx.weakly_connected_components(G), key=len)).copy()
+
+    def graph_from_address(self, address, dist):
+        """ Return the drive network within dist meters (bbox) of a gazetteer address, like ox.graph_from_address """
+        import osmnx as ox
+
+        north, south, east, west = ox.utils_geo.bbox_from_point(self.geocode(address), dist=dist)
+        return self.graph_from_bbox(north, south, east, west)
@@ -1,13 +1,4 @@
-import taxicab as tc
-from taxicab.plot import plot_graph_route
-from osmnx.plot import _save_and_show
-import networkx as nx
-import matplotlib.colors as mcolors
-
-import matplotlib.cm as cm
-import numpy as np
-
-import matplotlib.pyplot as plt
+# taxicab, osmnx and matplotlib are slow to import, so they are only imported inside the functions that use them
 
 def plot_graph_routes(G, routes, route_colors="r", route_linewidths=4, **pgr_kwargs):
     """
@@ -31,6 +22,9 @@ def plot_graph_routes(G, routes, route_colors="r", route_linewidths=4, **pgr_kwa
     fig, ax : tuple
         matplotlib figure, axis
     """
+    from taxicab.plot import plot_graph_route
+    from osmnx.plot import _save_and_show
+
     # check for valid arguments
     # if not all(isinstance(r, list) for r in routes):  # pragma: no cover
     #     raise ValueError("routes must be a list of route lists")
@@ -88,16 +82,28 @@ def plot_graph_routes(G, routes, route_colors="r", route_linewidths=4, **pgr_kwa
 
 
 def plot_our_route(G, route, color_mapping):
+    import taxicab as tc
+    import networkx as nx
+    import matplotlib.colors as mcolors
     
     route_pairs = list(zip(route[:-1], route[1:]))
 
     # get shortest path between route nodes
     route_legs = []
     for orig, dest in route_pairs:
-        try:
-            leg = tc.distance.shortest_path(G, orig, dest)
-        # if no path exists between two points:
-        except nx.NetworkXNoPath: 
+        # taxicab fails on some pairs of points on adjacent edges (see travel_times.tc_length_and_time),
+        # nudge the origin by a few meters until it doesn't
+        leg = None
+        for k in range(10):
+            try:
+                leg = tc.distance.shortest_path(G, (orig[0] + k * 1e-5, orig[1] + k * 1e-5), dest)
+                break
+            # if no path exists between two points:
+            except nx.NetworkXNoPath:
+                return None, None
+            except Exception:
+                continue
+        if leg is None:
             return None, None
         route_legs.append(leg)
         
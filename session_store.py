@@ -0,0 +1,178 @@
+"""
+Process-wide storage for the app's per-session data.
+
+st.session_state is kept per browser session, so storing the OSMnx graph there
+means every session holds its own copy of the same neighborhood. Instead graphs
+are shared across sessions by key (they are never modified after being built),
+figures are kept as PNG bytes rather than live matplotlib Figures, and each
+session's data is tracked so its memory use can be reported, and idle sessions
+(or the least recently used ones, once all sessions together hold too much)
+can be evicted.
+
+This module does not import streamlit, the app passes in its own session ID.
+"""
+import io
+import sys
+import threading
+import time
+
+
+def fig_to_png(fig, dpi=100):
+    """ Render a matplotlib figure to PNG bytes and close it so the figure's memory is freed """
+    import matplotlib.pyplot as plt
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight', pil_kwargs={'optimize': True})
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def sizeof(value):
+    """ Rough size of a stored value in bytes """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, 'memory_usage'): # pandas DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'): # numpy array
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class SessionStore:
+    """Shared graphs plus per-session values, with memory accounting and idle-session eviction.
+
+    Parameters:
+    -----------
+    max_idle : float, optional
+        Seconds after which a session that has not been touched is evicted by evict_idle. Default is 30 minutes.
+    max_bytes : int, optional
+        Bound on the bytes held by all sessions' own values (shared graphs are not counted), enforced by evict_idle.
+        Default is no bound.
+    """
+
+    def __init__(self, max_idle=30*60, max_bytes=None):
+        self.max_idle = max_idle
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._graphs = {} # graph key -> graph, shared read-only by every session using that key
+        self._sessions = {} # session ID -> {'last_access': float, 'graph_key': key or None, 'data': dict}
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {'last_access': time.time(), 'graph_key': None, 'data': {}}
+        return session
+
+    def touch(self, session_id):
+        """ Mark a session as active """
+        with self._lock:
+            self._session(session_id)['last_access'] = time.time()
+
+    def get_graph(self, session_id, key, build=None):
+        """Return the shared graph for key, building it with build() if no session has it yet.
+
+        The session now references this graph (dropping its reference to any previous one). Returns None if the
+        graph is not loaded and build is not given, e.g. after the session was evicted.
+        """
+        with self._lock:
+            G = self._graphs.get(key)
+        if G is None:
+            if build is None:
+                return None
+            # build outside the lock, other sessions shouldn't wait on a download
+            G = build()
+        with self._lock:
+            G = self._graphs.setdefault(key, G)
+            session = self._session(session_id)
+            previous = session['graph_key']
+            session['graph_key'] = key
+            session['last_access'] = time.time()
+            if previous is not None and previous != key:
+                self._release_graph(previous)
+        return G
+
+    def session_graph(self, session_id):
+        """ Return the graph the session last loaded, or None """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session['graph_key'] is None:
+                return None
+            return self.get_graph(session_id, session['graph_key'])
+
+    def _release_graph(self, key):
+        # drop a graph once no session references it anymore
+        if not any(s['graph_key'] == key for s in self._sessions.values()):
+            self._graphs.pop(key, None)
+
+    def put(self, session_id, name, value):
+        with self._lock:
+            session = self._session(session_id)
+            session['data'][name] = value
+            session['last_access'] = time.time()
+
+    def put_figure(self, session_id, name, fig):
+        """ Store a matplotlib figure as PNG bytes (closing the figure) and return the bytes """
+        png = fig_to_png(fig)
+        self.put(session_id, name, png)
+        return png
+
+    def get(self, session_id, name, default=None):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return default
+            session['last_access'] = time.time()
+            return session['data'].get(name, default)
+
+    def memory_usage(self, session_id):
+        """ Bytes held by a session's own values, shared graphs are not included """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return 0
+            return sum(sizeof(value) for value in session['data'].values())
+
+    def memory_report(self):
+        """ Return {session ID: bytes} for every session plus the number of shared graphs under 'graphs' """
+        with self._lock:
+            report = {session_id: self.memory_usage(session_id) for session_id in self._sessions}
+            report['graphs'] = len(self._graphs)
+            return report
+
+    def evict(self, session_id):
+        """ Drop a session's values and its graph reference """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None and session['graph_key'] is not None:
+                self._release_graph(session['graph_key'])
+
+    def evict_idle(self, now=None):
+        """Evict every session idle for longer than max_idle and return their IDs.
+
+        If the remaining sessions still hold more than max_bytes, the least recently used ones are evicted too, but
+        never the most recently used session.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            evicted = [sid for sid, s in self._sessions.items() if now - s['last_access'] > self.max_idle]
+            for session_id in evicted:
+                self.evict(session_id)
+            if self.max_bytes is not None:
+                by_age = sorted(self._sessions, key=lambda sid: self._sessions[sid]['last_access'])
+                usage = {session_id: self.memory_usage(session_id) for session_id in by_age}
+                total = sum(usage.values())
+                for session_id in by_age[:-1]:
+                    if total <= self.max_bytes:
+                        break
+                    total -= usage[session_id]
+                    self.evict(session_id)
+                    evicted.append(session_id)
+        return evicted
+
+
+# shared by every session in the process
+store = SessionStore(max_bytes=256 * 2**20)
@@ -0,0 +1,134 @@
+"""
+Tests for the routing MIP helpers (arc pruning and solution decoding) and, when gurobipy and a license are
+available, diverse route generation on tiny instances.
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+import MIP
+
+
+def random_instance(seed, num_students=4, num_schools=2):
+    rng = np.random.RandomState(seed)
+    np.random.seed(seed)
+    n = num_students + num_schools + 1
+    # stops spread over ~40 km so that the time windows actually bind and arcs get pruned
+    coords = {i: (40.6 + rng.rand() * 0.4, -74.0 + rng.rand() * 0.4) for i in range(n)}
+    start_times = MIP.generate_start_times(num_schools)
+    choices = MIP.generate_school_choices(num_students, num_schools)
+    return coords, start_times, choices
+
+
+def feasible_orders(num_students, num_schools, start_times, choices, travel_time):
+    """ Every visiting order (depot first) that satisfies the MIP's pickup order and dropoff windows, by brute force """
+    P = list(range(1, 1 + num_students))
+    S = list(range(num_students + 1, num_students + num_schools + 1))
+    earliest, latest = MIP.school_time_windows(num_students, num_schools, start_times)
+    school_of = {p: choices[p-1] for p in P}
+    for order in itertools.permutations(P + S):
+        order = (0,) + order
+        position = {node: k for k, node in enumerate(order)}
+        if any(position[p] > position[school_of[p]] for p in P):
+            continue
+        # leave the depot as late as possible, then arrive as early as possible and wait for the dropoff window
+        t = -np.inf
+        for i, j in zip(order, order[1:]):
+            t = t + travel_time[i, j] + MIP.student_loading_buffer
+            if j in S:
+                t = max(t, earliest[j])
+                if t > latest[j]:
+                    break
+        else:
+            yield order
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_candidate_arcs_structure(seed):
+    num_students, num_schools = 6, 3
+    coords, start_times, choices = random_instance(seed, num_students, num_schools)
+    arcs = MIP.candidate_arcs(num_students, num_schools, start_times, choices, coords)
+    assert len(set(arcs)) == len(arcs)
+    for i, j in arcs:
+        assert i != j
+        assert j != 0 # nothing goes back into the depot
+        if j <= num_students:
+            assert choices[j-1] != i # a school is never followed by its own student
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_candidate_arcs_keep_feasible_routes(seed):
+    # with travel times at exactly the lower bound, every feasible route must only use kept arcs
+    num_students, num_schools = 4, 2
+    coords, start_times, choices = random_instance(seed, num_students, num_schools)
+    arcs = set(MIP.candidate_arcs(num_students, num_schools, start_times, choices, coords))
+    travel_time = MIP.travel_time_lower_bounds(coords)
+    for order in feasible_orders(num_students, num_schools, start_times, choices, travel_time):
+        assert set(zip(order, order[1:])) <= arcs
+
+
+def test_candidate_arcs_speed():
+    num_students, num_schools = 6, 3
+    coords, start_times, choices = random_instance(0, num_students, num_schools)
+    # a higher speed bound can only keep more arcs
+    slow = set(MIP.candidate_arcs(num_students, num_schools, start_times, choices, coords, speed=10))
+    fast = set(MIP.candidate_arcs(num_students, num_schools, start_times, choices, coords, speed=50))
+    assert slow <= fast
+
+
+def test_decode_node_orders():
+    rng = np.random.RandomState(0)
+    n = 9
+    node_orders = np.array([np.concatenate([[0], rng.permutation(np.arange(1, n + 1))]) for _ in range(50)])
+    # Y[j] is the position of node j after the depot, plus some solver noise
+    positions = np.argsort(node_orders[:, 1:], axis=1) + rng.uniform(-0.3, 0.3, (50, n))
+    positions[[3, 7]] = 0 # two solutions that don't decode to a route
+    decoded, valid = MIP.decode_node_orders(positions)
+    assert valid.tolist() == [k not in (3, 7) for k in range(50)]
+    np.testing.assert_array_equal(decoded[valid], node_orders[valid])
+    assert MIP.decode_node_order(positions[0]).tolist() == node_orders[0].tolist()
+    assert MIP.decode_node_order(positions[3]) is None
+
+
+@pytest.fixture(scope='module')
+def gurobi_env():
+    gp = pytest.importorskip('gurobipy')
+    try:
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+    except gp.GurobiError as e:
+        pytest.skip(f'no Gurobi license: {e}')
+    yield env
+    env.dispose()
+
+
+@pytest.mark.parametrize('method', ['nogood', 'perturb', None])
+@pytest.mark.parametrize('seed', range(3))
+def test_diverse_routes_are_distinct_and_feasible(gurobi_env, method, seed):
+    num_students, num_schools = 3, 2
+    # stops within ~2 km, so every school can be reached in its window and there are many feasible orderings
+    rng = np.random.RandomState(seed)
+    np.random.seed(seed)
+    coords = {i: (40.72 + rng.rand() * 0.02, -73.95 + rng.rand() * 0.02) for i in range(num_students + num_schools + 1)}
+    start_times = MIP.generate_start_times(num_schools)
+    choices = MIP.generate_school_choices(num_students, num_schools)
+    travel_time = MIP.travel_time_lower_bounds(coords, speed=5)
+    feasible = set(feasible_orders(num_students, num_schools, start_times, choices, travel_time))
+
+    node_orders, arrivals, stats = MIP.get_diverse_routes(num_students, num_schools, start_times, travel_time, coords,
+                                                          n_routes=len(feasible) + 5, choices=choices, method=method,
+                                                          env=gurobi_env, as_arrays=True)
+    orders = [tuple(order) for order in node_orders]
+    assert len(set(orders)) == len(orders) == stats['unique'] > 0
+    assert set(orders) <= feasible
+    earliest, latest = MIP.school_time_windows(num_students, num_schools, start_times)
+    for order, times in zip(node_orders, arrivals):
+        assert np.all(times[1:] - times[:-1] >= travel_time[order[:-1], order[1:]] + MIP.student_loading_buffer - 1)
+        schools = order[order > num_students]
+        assert np.all(times[order > num_students] >= earliest[schools] - 1)
+        assert np.all(times[order > num_students] <= latest[schools] + 1)
+    if method == 'nogood':
+        # a cut per ordering found, so the re-solves enumerate every feasible ordering
+        assert set(orders) == feasible
@@ -0,0 +1,62 @@
+"""
+Tests for the batched solver, on tiny instances that fit in Gurobi's size-limited license. Skipped without gurobipy
+or a license.
+"""
+import numpy as np
+import pytest
+
+import MIP
+
+gp = pytest.importorskip('gurobipy')
+try:
+    with gp.Env(empty=True) as env:
+        env.setParam('OutputFlag', 0)
+        env.start()
+except gp.GurobiError as e:
+    pytest.skip(f'no Gurobi license: {e}', allow_module_level=True)
+
+from batch_solver import SolverRunner
+
+
+def scenario(seed, num_students=3, num_schools=2):
+    """ Stops within ~2 km of each other, with straight-line travel times at 5 m/s """
+    rng = np.random.RandomState(seed)
+    np.random.seed(seed)
+    coords = {i: (40.72 + rng.rand() * 0.02, -73.95 + rng.rand() * 0.02) for i in range(num_students + num_schools + 1)}
+    return {'num_students': num_students, 'num_schools': num_schools,
+            'start_times': MIP.generate_start_times(num_schools),
+            'travel_time': MIP.travel_time_lower_bounds(coords, speed=5),
+            'choices': MIP.generate_school_choices(num_students, num_schools)}, coords
+
+
+def cost(scenario, node_order, arrivals):
+    """ The MIP objective of a route: travel time plus loading buffers, minus the depot departure over 100 """
+    legs = zip(node_order, node_order[1:])
+    return sum(scenario['travel_time'][i, j] + MIP.student_loading_buffer for i, j in legs) - arrivals[0] / 100
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_solve_matches_get_feasible_routes(seed):
+    s, coords = scenario(seed)
+    node_orders, arrivals = MIP.get_feasible_routes(s['num_students'], s['num_schools'], s['start_times'],
+                                                    s['travel_time'], coords, choices=s['choices'], as_arrays=True)
+    with SolverRunner() as runner:
+        runner_orders, runner_arrivals = runner.solve(s)
+    assert len(runner_orders) > 0
+    assert cost(s, runner_orders[0], runner_arrivals[0]) == pytest.approx(cost(s, node_orders[0], arrivals[0]), rel=1e-3)
+
+
+def test_run_reuses_models():
+    # two sizes, each solved several times: one skeleton per size, results in the order given
+    scenarios = [scenario(seed, num_schools=1 + seed % 2)[0] for seed in range(6)]
+    with SolverRunner(max_routes=3) as runner:
+        results = runner.run(scenarios)
+        assert sorted(runner._models[0]) == [(3, 1), (3, 2)]
+        assert runner.stats['scenarios'] == 6
+        for s, (node_orders, arrivals) in zip(scenarios, results):
+            assert 0 < len(node_orders) <= 3
+            assert node_orders.shape[1] == s['num_students'] + s['num_schools'] + 1
+            # the same as solving the scenario on its own
+            single_orders, single_arrivals = runner.solve(s)
+            assert cost(s, node_orders[0], arrivals[0]) == \
+                pytest.approx(cost(s, single_orders[0], single_arrivals[0]), rel=1e-3)
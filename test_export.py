@@ -0,0 +1,80 @@
+"""
+Tests for exporting routes and formatting arrival times (no Gurobi, road network or network access needed).
+"""
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import export
+
+
+def test_format_times_matches_strftime():
+    seconds = np.random.RandomState(0).randint(0, 86400, 1000)
+    seconds[:3] = [0, 86399, 3600 * 7 + 30]
+    midnight = datetime(2000, 1, 1)
+    expected = [(midnight + timedelta(seconds=int(s))).strftime('%H:%M:%S') for s in seconds]
+    assert export.format_times(seconds).tolist() == expected
+    assert export.format_times(seconds.reshape(10, 100)).ravel().tolist() == expected
+    assert [export.format_seconds(s) for s in seconds] == expected
+    np.testing.assert_array_equal(export.to_seconds_array(expected), seconds)
+
+
+@pytest.fixture
+def routes():
+    rng = np.random.RandomState(0)
+    coords = {i: (40.7 + rng.rand() / 10, -73.9 - rng.rand() / 10) for i in range(6)}
+    node_orders = np.array([np.concatenate([[0], rng.permutation(np.arange(1, 6))]) for _ in range(3)])
+    arrivals = np.sort(rng.randint(6 * 3600, 9 * 3600, (3, 6)), axis=1)
+    return coords, node_orders, arrivals
+
+
+def test_zip_round_trip(routes):
+    coords, node_orders, arrivals = routes
+    f = io.BytesIO()
+    assert export.write_routes(f, node_orders, arrivals, coords, fmt='zip') == 3
+    with zipfile.ZipFile(io.BytesIO(f.getvalue())) as archive:
+        assert archive.namelist() == ['route_1.csv', 'route_2.csv', 'route_3.csv']
+        for name, node_order, times in zip(archive.namelist(), node_orders, arrivals):
+            rows = list(csv.reader(io.TextIOWrapper(archive.open(name), encoding='utf-8')))
+            assert rows[0] == export.CSV_COLUMNS
+            assert [int(row[1]) for row in rows[1:]] == node_order.tolist()
+            assert [(float(row[2]), float(row[3])) for row in rows[1:]] == [coords[i] for i in node_order]
+            assert export.to_seconds_array([row[4] for row in rows[1:]]).tolist() == times.tolist()
+
+
+def test_geojson_round_trip(routes):
+    coords, node_orders, arrivals = routes
+    f = io.BytesIO()
+    export.write_routes(f, node_orders, arrivals, coords, fmt='geojson')
+    features = json.loads(f.getvalue())['features']
+    for route, (node_order, times) in enumerate(zip(node_orders, arrivals)):
+        stops = [ft for ft in features if ft['geometry']['type'] == 'Point' and ft['properties']['route'] == route]
+        assert [ft['properties']['node_id'] for ft in stops] == node_order.tolist()
+        assert [tuple(ft['geometry']['coordinates'][::-1]) for ft in stops] == [coords[i] for i in node_order]
+        assert export.to_seconds_array([ft['properties']['arrival_time'] for ft in stops]).tolist() == times.tolist()
+        legs = [ft for ft in features if ft['geometry']['type'] == 'LineString' and ft['properties']['route'] == route]
+        assert [(ft['properties']['from'], ft['properties']['to']) for ft in legs] == list(zip(node_order, node_order[1:]))
+
+
+def test_parquet_round_trip(routes, tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    coords, node_orders, arrivals = routes
+    path = tmp_path / 'routes.parquet'
+    export.write_routes(path, node_orders, arrivals, coords)
+    table = pq.read_table(path)
+    assert table.column('route').to_pylist() == np.repeat(np.arange(3), 6).tolist()
+    assert table.column('node_id').to_pylist() == node_orders.ravel().tolist()
+    assert list(zip(table.column('latitude').to_pylist(), table.column('longitude').to_pylist())) == \
+        [coords[i] for i in node_orders.ravel()]
+    # Parquet has no second resolution time type, the column is read back as time32[ms]
+    assert [t.strftime('%H:%M:%S') for t in table.column('arrival_time').to_pylist()] == \
+        export.format_times(arrivals.ravel()).tolist()
+    assert table.column('leg').to_pylist()[:2] == [None, [list(coords[node_orders[0, 0]][::-1]),
+                                                       list(coords[node_orders[0, 1]][::-1])]]
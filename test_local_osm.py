@@ -0,0 +1,117 @@
+"""
+Tests for the offline OSM provider, on a tiny .osm extract and gazetteer written to a temporary directory.
+"""
+import csv
+import json
+import os
+
+import pytest
+
+import local_osm
+import travel_times
+
+
+# a 4 x 4 grid of residential streets (~200 m apart) plus ways that must not end up in a drive network
+GRID_LAT, GRID_LON, STEP = 40.700, -73.950, 0.002
+BBOX = (40.710, 40.690, -73.940, -73.960) # (north, south, east, west) around the grid
+
+
+def write_extract(path):
+    nodes, ways = [], []
+    grid = {}
+    for r in range(4):
+        for c in range(4):
+            grid[r, c] = len(nodes) + 1
+            nodes.append((GRID_LAT + r * STEP, GRID_LON + c * STEP))
+    def node(lat, lon):
+        nodes.append((lat, lon))
+        return len(nodes)
+    for r in range(4):
+        ways.append(([grid[r, c] for c in range(4)], {'highway': 'residential', 'name': f'Row {r}', 'maxspeed': '25 mph'}))
+    for c in range(4):
+        ways.append(([grid[r, c] for r in range(4)], {'highway': 'residential', 'name': f'Col {c}'}))
+    ways.append(([grid[0, 3], node(40.701, -73.943)], {'highway': 'footway'}))
+    ways.append(([grid[1, 3], node(40.703, -73.943)], {'highway': 'service', 'service': 'driveway'}))
+    ways.append(([grid[2, 3], node(40.705, -73.943)], {'highway': 'residential', 'access': 'private'}))
+    ways.append(([node(40.7005, -73.9495), node(40.7008, -73.9492), grid[0, 0]], {'building': 'yes'}))
+    # a drivable street that isn't connected to the grid
+    ways.append(([node(40.692, -73.958), node(40.692, -73.956)], {'highway': 'residential', 'name': 'Island'}))
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="test">']
+    lines.extend(f'  <node id="{k}" lat="{lat:.6f}" lon="{lon:.6f}" version="1"/>' for k, (lat, lon) in enumerate(nodes, 1))
+    for k, (refs, tags) in enumerate(ways, 100):
+        lines.append(f'  <way id="{k}" version="1">')
+        lines.extend(f'    <nd ref="{ref}"/>' for ref in refs)
+        lines.extend(f'    <tag k="{key}" v="{value}"/>' for key, value in tags.items())
+        lines.append('  </way>')
+    lines.append('</osm>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+
+
+@pytest.fixture
+def provider(tmp_path):
+    extract = tmp_path / 'tiny.osm'
+    write_extract(extract)
+    gazetteer = tmp_path / 'gazetteer.csv'
+    with open(gazetteer, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'lat', 'lon'])
+        writer.writerow(['Grid Center, Tiny Town', GRID_LAT + 1.5 * STEP, GRID_LON + 1.5 * STEP])
+    return local_osm.LocalOSMProvider(str(extract), str(gazetteer), cache_dir=str(tmp_path / 'cache'))
+
+
+@pytest.mark.parametrize('tags, drivable', [
+    ({'highway': 'residential'}, True),
+    ({'highway': 'primary', 'maxspeed': '30 mph'}, True),
+    ({'highway': 'service'}, False),
+    ({'highway': 'footway'}, False),
+    ({'highway': 'unclassified', 'service': 'driveway'}, False),
+    ({'highway': 'residential', 'access': 'private'}, False),
+    ({'highway': 'residential', 'motor_vehicle': 'no'}, False),
+    ({'highway': 'pedestrian', 'area': 'yes'}, False),
+    ({'building': 'yes'}, False),
+])
+def test_is_drivable(tags, drivable):
+    assert local_osm.is_drivable(tags) == drivable
+
+
+def test_geocode(provider):
+    assert provider.geocode('grid center,  TINY town') == (GRID_LAT + 1.5 * STEP, GRID_LON + 1.5 * STEP)
+    with pytest.raises(ValueError):
+        provider.geocode('Atlantis')
+
+
+def test_find_region(provider):
+    provider.index = [{'bbox': [41, 40, -73, -75], 'file': 'big.pkl'},
+                      {'bbox': [40.8, 40.6, -73.8, -74.1], 'file': 'small.pkl'}]
+    assert provider.find_region(40.75, 40.65, -73.9, -74.0)['file'] == 'small.pkl'
+    assert provider.find_region(40.9, 40.65, -73.9, -74.0)['file'] == 'big.pkl'
+    assert provider.find_region(42, 40.65, -73.9, -74.0) is None
+
+
+def test_graph_from_extract(provider):
+    pytest.importorskip('osmnx')
+
+    G = provider.graph_from_bbox(*BBOX)
+    # only the grid's residential streets: no footway, driveway, private road, building or disconnected island
+    assert {data['highway'] for _, _, data in G.edges(data=True)} == {'residential'}
+    assert all(data.get('access') != 'private' for _, _, data in G.edges(data=True))
+    assert min(y for _, y in G.nodes(data='y')) >= GRID_LAT - 1e-9
+    assert all('travel_time' in data for _, _, data in G.edges(data=True))
+
+    # the region is cached: a second provider reads it from the cache directory instead of the extract
+    with open(os.path.join(provider.cache_dir, 'regions.json')) as f:
+        assert len(json.load(f)) == 1
+    cached = local_osm.LocalOSMProvider(provider.extract_path, cache_dir=provider.cache_dir)
+    cached._build_region = None # would fail if called
+    assert sorted(cached.graph_from_bbox(*BBOX).nodes) == sorted(G.nodes)
+
+
+def test_generate_G_uses_provider(provider, monkeypatch):
+    pytest.importorskip('osmnx')
+
+    monkeypatch.setattr(travel_times, 'data_provider', provider)
+    G = travel_times.generate_G('name', ('Grid Center, Tiny Town', 300))
+    assert len(G) > 0
+    assert {data['highway'] for _, _, data in G.edges(data=True)} == {'residential'}
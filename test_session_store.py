@@ -0,0 +1,43 @@
+"""
+Tests for the process-wide session store.
+"""
+from session_store import SessionStore
+
+
+def test_session_store_shares_and_evicts_graphs():
+    store = SessionStore(max_idle=60)
+    built = []
+    def build():
+        built.append(object())
+        return built[-1]
+
+    G = store.get_graph('a', 'greenpoint', build)
+    assert store.get_graph('b', 'greenpoint', build) is G
+    assert len(built) == 1 # built once, shared by both sessions
+    store.put('a', 'png', b'x' * 1000)
+    assert store.memory_usage('a') == 1000
+
+    # 'a' is idle, 'b' is not: the graph stays as long as 'b' references it
+    store.touch('b')
+    store._sessions['a']['last_access'] -= 120
+    assert store.evict_idle() == ['a']
+    assert store.get('a', 'png') is None
+    assert store.session_graph('b') is G
+    store.evict('b')
+    assert store.memory_report() == {'graphs': 0}
+
+
+def test_session_store_bounds_memory():
+    store = SessionStore(max_bytes=2500)
+    for k, session_id in enumerate(['a', 'b', 'c']):
+        store.put(session_id, 'png', b'x' * 1000)
+        store._sessions[session_id]['last_access'] = 1000 + k
+    # over the bound, the least recently used session goes first
+    assert store.evict_idle(now=1010) == ['a']
+    assert sorted(store.memory_report()) == ['b', 'c', 'graphs']
+    # the most recently used session is kept even if it alone is over the bound
+    store.put('c', 'png', b'x' * 5000)
+    store._sessions['c']['last_access'] = 1003
+    assert store.evict_idle(now=1010) == ['b']
+    assert store.evict_idle(now=1010) == []
+    assert store.memory_usage('c') == 5000
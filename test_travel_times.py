@@ -0,0 +1,111 @@
+"""
+Tests for tiled graphs, on a synthetic street grid served through a fake data provider (no network access).
+"""
+import numpy as np
+import pytest
+
+import travel_times
+
+ox = pytest.importorskip('osmnx')
+nx = pytest.importorskip('networkx')
+from shapely.geometry import LineString
+
+
+# a jittered grid of two-way streets ~100 m apart, the east part of the service area is water
+WEST, SOUTH, STEP, N = -73.990, 40.700, 0.001, 31
+SERVICE_BBOX = (SOUTH + 0.027, SOUTH + 0.003, WEST + 0.045, WEST + 0.003) # (north, south, east, west)
+
+
+def grid_graph(seed=0):
+    rng = np.random.RandomState(seed)
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    for r in range(N):
+        for c in range(N):
+            G.add_node(r * N + c, y=SOUTH + r * STEP + rng.uniform(-2e-4, 2e-4),
+                       x=WEST + c * STEP + rng.uniform(-2e-4, 2e-4))
+    for r in range(N):
+        for c in range(N):
+            for r2, c2 in ((r + 1, c), (r, c + 1)):
+                if r2 < N and c2 < N:
+                    u, v = r * N + c, r2 * N + c2
+                    speed = 25 + 10 * ((r + c) % 3) # km/h
+                    for a, b in ((u, v), (v, u)):
+                        geometry = LineString([(G.nodes[a]['x'], G.nodes[a]['y']), (G.nodes[b]['x'], G.nodes[b]['y'])])
+                        length = ox.distance.great_circle_vec(G.nodes[a]['y'], G.nodes[a]['x'],
+                                                              G.nodes[b]['y'], G.nodes[b]['x'])
+                        G.add_edge(a, b, length=length, speed_kph=speed, travel_time=length / (speed / 3.6),
+                                   geometry=geometry, highway='residential')
+    return G
+
+
+class GridProvider:
+    """ Serves bboxes of the grid like ox.graph_from_bbox, counting the calls """
+
+    def __init__(self, G):
+        self.G = G
+        self.calls = []
+
+    def graph_from_bbox(self, north, south, east, west):
+        self.calls.append((north, south, east, west))
+        return ox.truncate.truncate_graph_bbox(self.G, north, south, east, west, truncate_by_edge=True)
+
+
+@pytest.fixture
+def grid(monkeypatch):
+    G = grid_graph()
+    provider = GridProvider(G)
+    monkeypatch.setattr(travel_times, 'data_provider', provider)
+    return G, provider
+
+
+def test_sample_points_in_service_area(grid, tmp_path):
+    G, provider = grid
+    tiled = travel_times.TiledGraph(SERVICE_BBOX, tile_size=0.01, overlap=0.003, cache_dir=str(tmp_path))
+    np.random.seed(0)
+    coords = travel_times.generate_random_coords(tiled, 150, 50)
+    points = np.array([coords[i] for i in range(1, 201)])
+    north, south, east, west = SERVICE_BBOX
+    assert np.all((points[:, 0] >= south) & (points[:, 0] <= north) & (points[:, 1] >= west) & (points[:, 1] <= east))
+    # tiles on the water are skipped, so all points lie on the grid
+    assert points[:, 1].max() <= WEST + (N - 1) * STEP + 2e-4
+    assert len(tiled._empty) > 0
+
+    # with the road lengths cached, only the tiles that get sampled are loaded
+    tiled = travel_times.TiledGraph(SERVICE_BBOX, tile_size=0.01, overlap=0.003, cache_dir=str(tmp_path))
+    loaded = []
+    get_tile = tiled.get_tile
+    tiled.get_tile = lambda tile: loaded.append(tile) or get_tile(tile)
+    travel_times.generate_random_coords(tiled, 2, 1)
+    assert 1 <= len(loaded) <= 3
+
+
+def test_sample_points_weighted_by_road_length(grid):
+    tiled = travel_times.TiledGraph(SERVICE_BBOX, tile_size=0.01, overlap=0.003)
+    lengths = {tile: tiled.road_length(tile) for tile in tiled.all_tiles()}
+    # every edge of the service area counts towards exactly one tile
+    G, _ = grid
+    north, south, east, west = SERVICE_BBOX
+    in_area = sum(data['length'] for u, v, data in G.edges(data=True)
+                  if south <= (G.nodes[u]['y'] + G.nodes[v]['y']) / 2 <= north
+                  and west <= (G.nodes[u]['x'] + G.nodes[v]['x']) / 2 <= east)
+    assert sum(lengths.values()) == pytest.approx(in_area)
+
+    np.random.seed(1)
+    counts = {tile: 0 for tile in lengths}
+    for p in tiled.sample_points(2000):
+        counts[tiled.tile_index(p.y, p.x)] += 1
+    total = sum(lengths.values())
+    for tile, length in lengths.items():
+        assert counts[tile] / 2000 == pytest.approx(length / total, abs=0.03)
+
+
+def test_tiled_travel_times_match_full_graph(grid):
+    G, _ = grid
+    # stops in the middle of the grid, the tiles around them (with their overlap) hold every road the paths need
+    np.random.seed(2)
+    coords = {i: (SOUTH + 0.012 + np.random.rand() * 0.006, WEST + 0.012 + np.random.rand() * 0.006) for i in range(8)}
+    tiled = travel_times.TiledGraph((SOUTH + 0.03, SOUTH, WEST + 0.03, WEST), tile_size=0.005, overlap=0.006)
+    full_times = travel_times.calculate_travel_times(G, 5, 2, coords)
+    tiled_times = travel_times.calculate_travel_times(tiled, 5, 2, coords)
+    assert len(tiled.graph_for(coords)) < len(G)
+    np.testing.assert_allclose(tiled_times, full_times)
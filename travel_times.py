@@ -1,7 +1,12 @@
-import taxicab as tc
-import osmnx as ox
+import json
+import math
+import os
+from collections import OrderedDict
+
 import numpy as np
 
+# osmnx and taxicab are slow to import, so they are only imported inside the functions that use them
+
 
 xmin, xmax = -73.92860, -73.96260
 ymin, ymax = 40.7063, 40.7303
@@ -10,7 +15,49 @@ ymin, ymax = 40.7063, 40.7303
 # (40.7283, -73.94060)
 # (40.7403, -73.96260)
 
-def generate_G(mode, location_data):
+# local stand-in for Overpass/Nominatim (e.g. local_osm.LocalOSMProvider), see set_data_provider
+data_provider = None
+
+
+def set_data_provider(provider):
+    """Build graphs (and geocode addresses) with provider instead of downloading them.
+
+    provider needs graph_from_bbox(north, south, east, west), graph_from_address(address, dist) and geocode(query)
+    methods that behave like their osmnx counterparts, with edge speeds and travel times already added. Pass None to
+    go back to downloading.
+    """
+    global data_provider
+    data_provider = provider
+
+
+def get_data_provider():
+    """ The registered data provider, set up from the OSM_EXTRACT environment variable on first use if there is none """
+    global data_provider
+    if data_provider is None and os.environ.get('OSM_EXTRACT'):
+        from local_osm import LocalOSMProvider
+        data_provider = LocalOSMProvider.from_env()
+    return data_provider
+
+def generate_G(mode, location_data, tiled=False, tile_size=0.02, overlap=0.005, cache_dir=None):
+    """Build the drive network for a bbox or an address radius.
+
+    With tiled=True the area is not downloaded up front, instead a TiledGraph is returned that splits it into
+    overlapping tiles which are downloaded and cached on demand (see TiledGraph for tile_size, overlap and cache_dir).
+    A TiledGraph can be passed to generate_random_coords and calculate_travel_times only.
+    If a data provider is registered (see set_data_provider) the graph is built from local data instead.
+    """
+    import osmnx as ox
+
+    if tiled:
+        return TiledGraph(location_bbox(mode, location_data), tile_size=tile_size, overlap=overlap, cache_dir=cache_dir)
+
+    provider = get_data_provider()
+    if provider is not None:
+        if mode == 'name':
+            location, distance = location_data
+            return provider.graph_from_address(location, distance)
+        return provider.graph_from_bbox(*location_bbox(mode, location_data))
+
     # if given a bbox:
     if mode == 'bbox':
         ymax, ymin, xmin, xmax = location_data # location_data is a 4-tuple of xy values if 'bbox'
@@ -26,6 +73,235 @@ def generate_G(mode, location_data):
     return G
 
 
+def location_bbox(mode, location_data):
+    """ Return the (north, south, east, west) bounds of the area described by generate_G's mode/location_data """
+    if mode == 'bbox':
+        y1, y2, x1, x2 = location_data
+        return max(y1, y2), min(y1, y2), max(x1, x2), min(x1, x2)
+    if mode == 'name':
+        import osmnx as ox
+        location, distance = location_data
+        provider = get_data_provider()
+        point = provider.geocode(location) if provider is not None else ox.geocode(location)
+        return ox.utils_geo.bbox_from_point(point, dist=distance)
+    raise ValueError(f"mode must be 'bbox' or 'name', got {mode!r}")
+
+
+class TiledGraph:
+    """A service area split into overlapping tiles that are downloaded and cached independently.
+
+    Tiles lie on a fixed lat/lon grid, so areas that overlap share tiles (and their cache files). Each tile is
+    downloaded with `overlap` degrees of extra road network around it, and queries are answered on the union of the
+    fewest tiles covering the stops. Travel times match the full graph as long as that union holds every road the
+    shortest paths between the stops use (i.e. the paths stay within `overlap` of the stops' bounding box) and the
+    tiles were simplified the same way as the full graph; roads cut at a tile border can simplify differently.
+
+    Tiled mode only covers sampling stops (generate_random_coords) and travel times (calculate_travel_times). Plotting
+    functions such as app_generate_plots.plot_points and plot2.plot_our_route need a regular graph, pass them
+    graph_for(coords).
+
+    Parameters:
+    -----------
+    bbox : tuple
+        The (north, south, east, west) bounds of the service area.
+    tile_size : float, optional
+        Width and height of a tile in degrees. Default is 0.02 (about 2 km in NYC).
+    overlap : float, optional
+        Border (in degrees) added around each tile when it is downloaded. Default is 0.005 (about 500 m).
+    cache_dir : str, optional
+        Directory to save downloaded tiles to as GraphML. Tiles are only kept in memory if not given.
+    max_tiles : int, optional
+        Number of tile graphs kept in memory at once (least recently used are dropped first). Default is 16.
+    """
+
+    def __init__(self, bbox, tile_size=0.02, overlap=0.005, cache_dir=None, max_tiles=16):
+        self.bbox = bbox
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.cache_dir = cache_dir
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict() # (row, col) -> MultiDiGraph, in least to most recently used order
+        self._empty = set() # tiles without drivable roads (e.g. water)
+        self._union = (None, None) # (frozenset of tiles, composed graph) of the last query
+        self._lengths = {} # road length key (see road_length) -> meters of road of the tile inside the service area
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(self._lengths_path()):
+                with open(self._lengths_path()) as f:
+                    self._lengths = json.load(f)
+
+    def tile_index(self, y, x):
+        """ Return the (row, col) of the tile containing the point (y, x) """
+        return math.floor(y / self.tile_size), math.floor(x / self.tile_size)
+
+    def tiles_for_bbox(self, north, south, east, west):
+        """ Return the (row, col) of every tile intersecting the bbox """
+        r0, c0 = self.tile_index(south, west)
+        r1, c1 = self.tile_index(north, east)
+        return [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def all_tiles(self):
+        return self.tiles_for_bbox(*self.bbox)
+
+    def tile_bbox(self, tile):
+        """ Return the (north, south, east, west) bounds of a tile including its overlap border """
+        r, c = tile
+        return ((r + 1) * self.tile_size + self.overlap, r * self.tile_size - self.overlap,
+                (c + 1) * self.tile_size + self.overlap, c * self.tile_size - self.overlap)
+
+    def service_bbox(self, tile):
+        """ Return the (north, south, east, west) bounds of the part of a tile (without overlap) inside the service area """
+        r, c = tile
+        north, south, east, west = self.bbox
+        return (min(north, (r + 1) * self.tile_size), max(south, r * self.tile_size),
+                min(east, (c + 1) * self.tile_size), max(west, c * self.tile_size))
+
+    def _tile_path(self, tile):
+        r, c = tile
+        return os.path.join(self.cache_dir, f'tile_{self.tile_size}_{self.overlap}_{r}_{c}.graphml')
+
+    def _lengths_path(self):
+        return os.path.join(self.cache_dir, 'tile_lengths.json')
+
+    def get_tile(self, tile):
+        """Return the graph of a tile, loading it from memory, the cache directory or the network/data provider (in that order).
+
+        Returns None for a tile without drivable roads.
+        """
+        import osmnx as ox
+
+        if tile in self._tiles:
+            self._tiles.move_to_end(tile)
+            return self._tiles[tile]
+        if tile in self._empty:
+            return None
+
+        path = self._tile_path(tile) if self.cache_dir is not None else None
+        if path is not None and os.path.exists(path + '.empty'):
+            G = None
+        elif path is not None and os.path.exists(path):
+            G = ox.load_graphml(path)
+        else:
+            north, south, east, west = self.tile_bbox(tile)
+            # osmnx raises ValueErrors when there are no roads in the bbox, e.g. for a tile on the water
+            try:
+                if get_data_provider() is not None:
+                    G = get_data_provider().graph_from_bbox(north, south, east, west)
+                else:
+                    G = ox.graph_from_bbox(north, south, east, west, network_type="drive", simplify=True,
+                                           truncate_by_edge=True)
+                    G = ox.add_edge_speeds(G)
+                    G = ox.add_edge_travel_times(G)
+            except ValueError:
+                G = None
+            if G is not None and G.number_of_edges() == 0:
+                G = None
+            if path is not None:
+                if G is None:
+                    open(path + '.empty', 'w').close()
+                else:
+                    ox.save_graphml(G, path)
+
+        if G is None:
+            self._empty.add(tile)
+            return None
+
+        self._tiles[tile] = G
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return G
+
+    def graph_for(self, coords):
+        """Return the union of the tiles covering every stop in coords.
+
+        Parameters:
+        -----------
+        coords : dict
+            A dictionary mapping node IDs to (latitude, longitude) tuples.
+
+        Returns:
+        --------
+        networkx.MultiDiGraph
+            The road network around the stops.
+        """
+        import networkx as nx
+
+        ys = [y for y, x in coords.values()]
+        xs = [x for y, x in coords.values()]
+        tiles = frozenset(self.tiles_for_bbox(max(ys), min(ys), max(xs), min(xs)))
+        if self._union[0] == tiles:
+            return self._union[1]
+
+        graphs = [G for G in (self.get_tile(tile) for tile in sorted(tiles)) if G is not None]
+        if not graphs:
+            raise ValueError('there are no roads around the stops')
+        G = graphs[0] if len(graphs) == 1 else nx.compose_all(graphs)
+        self._union = (tiles, G)
+        return G
+
+    def _edges_in_area(self, tile, G):
+        """ The edges of a tile's graph whose midpoint lies in the tile (without overlap) and in the service area """
+        bbox = self.service_bbox(tile)
+        return [(u, v, k) for u, v, k in G.edges(keys=True)
+                if _in_bbox(bbox, (G.nodes[u]['y'] + G.nodes[v]['y']) / 2, (G.nodes[u]['x'] + G.nodes[v]['x']) / 2)]
+
+    def road_length(self, tile):
+        """Return the length (in meters) of the roads of a tile inside the service area, 0 for a tile without roads.
+
+        Every edge counts towards the tile containing its midpoint. Lengths are cached (in the cache directory if
+        there is one), so each tile only has to be loaded once to measure it.
+        """
+        key = '{}_{}_{}_{}_{:.6f}_{:.6f}_{:.6f}_{:.6f}'.format(self.tile_size, self.overlap, *tile, *self.service_bbox(tile))
+        if key not in self._lengths:
+            G = self.get_tile(tile)
+            self._lengths[key] = 0.0 if G is None else float(sum(G.edges[edge]['length'] for edge in self._edges_in_area(tile, G)))
+            if self.cache_dir is not None:
+                with open(self._lengths_path(), 'w') as f:
+                    json.dump(self._lengths, f, indent=2)
+        return self._lengths[key]
+
+    def sample_points(self, n, max_rounds=100):
+        """Sample n random points on the roads inside the service area, like ox.utils_geo.sample_points on the full graph.
+
+        Tiles are picked in proportion to their road_length, so sampling stays weighted by road length, and only the
+        picked tiles are loaded to sample on (measuring the road lengths loads every tile once, after that they come
+        from the cache). Points outside the service area are rejected and redrawn.
+
+        Returns:
+        --------
+        list of shapely.geometry.Point
+            The sampled points (x = longitude, y = latitude) in random order.
+        """
+        import osmnx as ox
+
+        tiles = self.all_tiles()
+        lengths = np.array([self.road_length(tile) for tile in tiles])
+        if lengths.sum() == 0:
+            raise ValueError('there are no roads in the service area')
+
+        picks = np.random.choice(len(tiles), n, p=lengths / lengths.sum())
+        points = []
+        for k in np.unique(picks):
+            tile, needed = tiles[k], int(np.sum(picks == k))
+            G = self.get_tile(tile)
+            G = G.edge_subgraph(self._edges_in_area(tile, G)).copy()
+            bbox = self.service_bbox(tile)
+            found = []
+            for _ in range(max_rounds):
+                found.extend(p for p in ox.utils_geo.sample_points(G, needed - len(found)) if _in_bbox(bbox, p.y, p.x))
+                if len(found) >= needed:
+                    break
+            else:
+                raise ValueError(f'could not sample {needed} points inside the service area on tile {tile}')
+            points.extend(found)
+        return [points[i] for i in np.random.permutation(len(points))]
+
+
+def _in_bbox(bbox, y, x):
+    north, south, east, west = bbox
+    return south <= y <= north and west <= x <= east
+
+
 def tc_length_and_time(G, orig, dest):
     """Calculate the shortest taxicab route between two points and return the length and time it takes to travel it.
 
@@ -45,6 +321,9 @@ def tc_length_and_time(G, orig, dest):
         entire route, route_time is the time (in seconds) it takes to travel the entire route, and taxi_route is a list of
         nodes representing the taxicab route taken (excluding the origin point but including the destination point).
     """
+    import osmnx as ox
+    import taxicab as tc
+
     # calculate taxicab shortest route
     taxi_route = None
     eps = 1e-4
@@ -55,7 +334,8 @@ def tc_length_and_time(G, orig, dest):
     # repeatedly add eps to x-coord or y-coord (alternating) until a solution is found
     while taxi_route is None:
         try:
-            taxi_route = tc.distance.shortest_path(G, _orig, _dest)
+            orig_edge, dest_edge = _nearest_edge(G, _orig), _nearest_edge(G, _dest)
+            taxi_route = tc.distance.shortest_path(G, _orig, _dest, orig_edge, dest_edge)
             route_length, interior_nodes, first_segment, last_segment = taxi_route
         except:
             if count == int(max_tries / 2): # reverse direction of search after 30 tries
@@ -75,16 +355,14 @@ def tc_length_and_time(G, orig, dest):
     interior_time = int(sum(ox.utils_graph.get_route_edge_attributes(G, interior_nodes, "travel_time")))
 
     # estimate average travel speed along the tail segments
-    tails = [first_segment, last_segment]
+    tails = [(first_segment, orig_edge), (last_segment, dest_edge)]
     speeds = []
-    for s in tails:
+    for s, edge in tails:
         if s != []:
-            # get the "tail" of the segment, tail is the non-node end, tail end is always the last item in the coords list
-            sx, sy = s.coords[-1]
-            # get edges nearest to tail segments, use edge length (m) and edge travel time (s) to estimate average travel speed in m/s (need to manually calculate)
-            nearest_edge = ox.nearest_edges(G, sx, sy)
-            nearest_edge = G.edges[nearest_edge]
-            total_len, total_time = nearest_edge['length'], nearest_edge['travel_time']
+            # the tail segments lie on the edges taxicab started and ended on, use their edge length (m) and edge travel
+            # time (s) to estimate the average travel speed in m/s (the edge nearest to the segment's node end would be
+            # ambiguous, every edge at that node is equally near)
+            total_len, total_time = G.edges[edge]['length'], G.edges[edge]['travel_time']
             speed = total_len / total_time
             speeds.append(speed)
     avg_tail_speed = np.mean(speeds)
@@ -100,12 +378,27 @@ def tc_length_and_time(G, orig, dest):
     return route_length, route_time, taxi_route
 
 
+def _nearest_edge(G, point):
+    """The (u, v, key) edge nearest to a (y, x) point.
+
+    Both directions of a two-way street are equally near, ox.nearest_edges returns whichever comes first in G, which
+    changes when graphs are composed (see TiledGraph.graph_for). The direction leaving the lower node ID is taken
+    instead, so taxicab's partial edges at the ends of a route don't depend on the order of G's edges.
+    """
+    import osmnx as ox
+
+    u, v, key = ox.nearest_edges(G, point[1], point[0])
+    if v < u and G.has_edge(v, u, key) and G.edges[v, u, key]['length'] == G.edges[u, v, key]['length']:
+        return v, u, key
+    return u, v, key
+
+
 def generate_random_coords(G, n_students, n_schools, depot_coords=(ymin, xmin)):
     """Generate random coordinates for students and schools, and return a dictionary mapping their IDs to coordinates.
 
     Parameters:
     -----------
-    G : networkx.MultiDiGraph
+    G : networkx.MultiDiGraph or TiledGraph
         The road network to sample the points from.
     n_students : int
         The number of student locations to generate.
@@ -120,8 +413,13 @@ def generate_random_coords(G, n_students, n_schools, depot_coords=(ymin, xmin)):
         A dictionary mapping the IDs of the student and school locations to their respective coordinate tuples, of the form
         {depot, students..., schools...}.
     """
+    import osmnx as ox
+
     # randomly sample student and school locations
-    random_locs = ox.utils_geo.sample_points(G, n_students + n_schools)
+    if isinstance(G, TiledGraph):
+        random_locs = G.sample_points(n_students + n_schools)
+    else:
+        random_locs = ox.utils_geo.sample_points(G, n_students + n_schools)
 
     # convert GeoSeries to dict of IDs and coordinate tuples (y, x)
     # {depot, students..., schools...}
@@ -132,26 +430,43 @@ def generate_random_coords(G, n_students, n_schools, depot_coords=(ymin, xmin)):
     return coords
 
 
-def calculate_travel_times(G, n_students, n_schools, coords):
+def calculate_travel_times(G, n_students, n_schools, coords, arcs=None):
     """Calculate the travel times between all student and school locations.
 
     Parameters:
     -----------
+    G : networkx.MultiDiGraph or TiledGraph
+        The road network to compute the routes on. For a TiledGraph only the tiles covering coords are loaded.
     n_students : int
         The number of student locations to generate.
     n_schools : int
         The number of school locations to generate.
-    depot_coords : tuple, optional
-        A tuple (latitude, longitude) representing the depot location. Default is (ymin, xmin).
+    coords : dict
+        A dictionary mapping the IDs of the depot, student and school locations to (latitude, longitude) tuples.
+    arcs : list of tuple, optional
+        Only calculate the travel times of these (i, j) pairs, e.g. from MIP.candidate_arcs.
 
     Returns:
     --------
-    numpy.ndarray
+    numpy.ndarray or dict
         An n+1 x n+1 numpy array representing the travel times (in seconds) between all locations, where n = n_students + n_schools.
         The first row and column of the array represent the depot location, and the remaining rows and columns represent the student
         and school locations, respectively.
+        If arcs is given, a sparse dictionary mapping each (i, j) arc to its travel time (in seconds) instead.
     """ 
     
+    # only search the part of a tiled graph around the stops
+    if isinstance(G, TiledGraph):
+        G = G.graph_for(coords)
+
+    # only calculate the requested arcs
+    if arcs is not None:
+        print(f'Calculating travel times of {len(arcs)} arcs...')
+        travel_times = {}
+        for i, j in arcs:
+            travel_times[i, j] = _travel_time(G, coords[i], coords[j])
+        return travel_times
+
     # initialize travel_times as array of zeros
     travel_times = np.zeros((len(coords), len(coords)))
 
@@ -160,19 +475,31 @@ def calculate_travel_times(G, n_students, n_schools, coords):
     for i in coords:
         for j in coords:
             if i != j:
-                orig = coords[i]
-                dest = coords[j]
-                result = tc_length_and_time(G, orig, dest)
-                if result is not None:   
-                    _, t, _ = result
-                    travel_times[i, j] = t
-                else:
-                    travel_times[i, j] = 1000000 # set to arbitrarily large number if no travel time is found?
+                travel_times[i, j] = _travel_time(G, coords[i], coords[j])
         print(f'\tprogress: {i+1} / {len(coords)}')
     
     return travel_times
 
 
+def max_edge_speed(G, coords=None):
+    """Return the highest edge speed of a road network in m/s, from the speed_kph values of ox.add_edge_speeds.
+
+    Travel times on G are never shorter than the straight-line distance at this speed, so it can be passed to
+    MIP.candidate_arcs as an exact bound. For a TiledGraph only the tiles covering coords are considered.
+    """
+    if isinstance(G, TiledGraph):
+        G = G.graph_for(coords)
+    return max(float(speed) for _, _, speed in G.edges(data='speed_kph')) / 3.6
+
+
+def _travel_time(G, orig, dest):
+    result = tc_length_and_time(G, orig, dest)
+    if result is not None:   
+        _, t, _ = result
+        return t
+    return 1000000 # set to arbitrarily large number if no travel time is found?
+
+
 def generate_random_load_times(n_students, n_schools):
     """Generate random load times for students and schools, and return a dictionary mapping their IDs to their respective load times.
 